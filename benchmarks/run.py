@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from pathlib import Path
+
+import httpx
+
+root = Path(__file__).resolve().parent
+fixture = root.joinpath("fixture", "public")
+src = root.parent.joinpath("src")
+
+scenarios = {
+    "static-css":    {"path": "/assets/css/main.css", "status": 200},
+    "static-svg":    {"path": "/assets/images/favicon.svg", "status": 200},
+    "template":      {"path": "/", "status": 200},
+    "markdown":      {"path": "/about/", "status": 200},
+    "markdown-mode": {"path": "/", "headers": {"user-agent": "curl/8.0"}, "status": 200},
+    "thumbnail":     {"path": "/assets/images/thumbnails/about?title=About&description=Fixture", "status": 200},
+    "shorturl":      {"path": "/gh", "status": 307},
+    "not-found":     {"path": "/does-not-exist", "status": 404},
+    "subdomain":     {"path": "/", "headers": {"host": "docs.localhost"}, "status": 200},
+}
+
+def prepare_site() -> Path:
+    site = Path(tempfile.mkdtemp(prefix="nercone-website-bench-"))
+    shutil.copytree(fixture, site.joinpath("public"))
+    for name in ["logs", "databases", "caches"]:
+        site.joinpath(name).mkdir()
+    return site
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+async def request(client: httpx.AsyncClient, scenario: dict) -> httpx.Response:
+    headers = {"host": "localhost", "accept-encoding": "br, gzip", "user-agent": "nercone-website-bench"} | scenario.get("headers", {})
+    return await client.get(scenario["path"], headers=headers)
+
+async def run_scenario(client: httpx.AsyncClient, name: str, scenario: dict, requests: int, warmup: int, concurrency: int, measure_allocations: bool) -> dict:
+    for _ in range(warmup):
+        response = await request(client, scenario)
+        if response.status_code != scenario["status"]:
+            raise RuntimeError(f"{name}: expected {scenario['status']}, got {response.status_code}")
+
+    latencies = []
+    remaining = requests
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await request(client, scenario)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "requests": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+    }
+
+    if measure_allocations:
+        samples = min(requests, 200)
+        peaks = []
+        tracemalloc.start()
+        for _ in range(samples):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await request(client, scenario)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        result["alloc_peak_kib"] = round(statistics.fmean(peaks) / 1024, 1)
+    return result
+
+async def run_in_process(site: Path, names: list[str], args) -> dict:
+    os.chdir(site)
+    sys.path.insert(0, str(src))
+    from nercone_website.server import app
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app, client=("127.0.0.1", 0))
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+            for name in names:
+                results[name] = await run_scenario(client, name, scenarios[name], args.requests, args.warmup, args.concurrency, True)
+                print_result(name, results[name])
+    return results
+
+async def run_uvicorn(site: Path, names: list[str], args) -> dict:
+    env = os.environ | {"PYTHONPATH": os.pathsep.join([str(src), os.environ.get("PYTHONPATH", "")])}
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "nercone_website.server:app", "--port", str(args.port), "--no-access-log", "--log-level", "warning"], cwd=site, env=env)
+    results = {}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}") as client:
+            for _ in range(100):
+                try:
+                    await client.get("/ping", headers={"host": "localhost"})
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            for name in names:
+                results[name] = await run_scenario(client, name, scenarios[name], args.requests, args.warmup, args.concurrency, False)
+                print_result(name, results[name])
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+def print_result(name: str, result: dict):
+    line = f"{name:<14} {result['throughput']:>9.1f} req/s  p50 {result['p50_ms']:>8.3f} ms  p95 {result['p95_ms']:>8.3f} ms  p99 {result['p99_ms']:>8.3f} ms"
+    if "alloc_peak_kib" in result:
+        line += f"  alloc {result['alloc_peak_kib']:>8.1f} KiB"
+    print(line, file=sys.stderr, flush=True)
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        if (base := baseline.get("scenarios", {}).get(name)) is None:
+            continue
+        for metric in ["p50_ms", "p99_ms", "alloc_peak_kib"]:
+            if metric in result and metric in base and result[metric] > base[metric] * (1 + threshold):
+                regressions.append(f"{name}: {metric} {base[metric]} -> {result[metric]}")
+        if result["throughput"] < base["throughput"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['throughput']} -> {result['throughput']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark nercone_website.server:app against the fixture public/ tree.")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default: all of {', '.join(scenarios)})")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent requests in flight")
+    parser.add_argument("--uvicorn", action="store_true", help="run against a local uvicorn process instead of in-process")
+    parser.add_argument("--port", type=int, default=18080, help="port for --uvicorn")
+    parser.add_argument("--baseline", type=Path, help="baseline JSON to compare against; exits with 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown before a result counts as a regression")
+    parser.add_argument("--save", type=Path, help="write the results as JSON (use this to record a new baseline)")
+    args = parser.parse_args()
+
+    names = args.scenarios or list(scenarios)
+    if unknown := [name for name in names if name not in scenarios]:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    site = prepare_site()
+    try:
+        runner = run_uvicorn if args.uvicorn else run_in_process
+        results = asyncio.run(runner(site, names, args))
+    finally:
+        shutil.rmtree(site, ignore_errors=True)
+
+    report = {
+        "mode": "uvicorn" if args.uvicorn else "asgi",
+        "python": platform.python_version(),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "scenarios": results,
+    }
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=4) + "\n")
+    else:
+        print(json.dumps(report, indent=4))
+
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
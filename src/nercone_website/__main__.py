@@ -1,7 +1,16 @@
+import os
+import sys
+import json
+import shutil
+import asyncio
+import subprocess
 import uvicorn
-from .config import Files, Directories
+import argparse
+from pathlib import Path
+from .config import Files, Directories, Server, WebSockets
 
-def main():
+def serve(workers: int = Server.workers):
+    workers = workers or os.cpu_count() or 1
     log_config = {
         "version": 1,
         "disable_existing_loggers": False,
@@ -26,10 +35,125 @@ def main():
         "loggers": {
             "uvicorn": {"handlers": ["file", "console"], "level": "INFO", "propagate": False},
             "uvicorn.error": {"handlers": ["file", "console"], "level": "INFO", "propagate": False},
-            "uvicorn.access": {"handlers": ["file", "console"], "level": "INFO", "propagate": False}
+            "uvicorn.access": {"handlers": ["file", "console"], "level": "INFO", "propagate": False},
+            "nercone_website": {"handlers": ["file", "console"], "level": "INFO", "propagate": False}
         }
     }
-    uvicorn.run("nercone_website.server:app", host="0.0.0.0", port=8080, workers=1, server_header=False, log_config=log_config)
+    options = dict(host="0.0.0.0", port=8080, workers=workers, server_header=False, log_config=log_config, ws_max_size=WebSockets.max_size, ws_max_queue=WebSockets.max_queue, ws_per_message_deflate=WebSockets.compression)
+    if workers == 1:
+        uvicorn.run("nercone_website.server:app", **options)
+        return
+
+    # Workers send their access log lines to this process, which is the only one writing logs/access.log.
+    from .logger import AccessLogServer
+    access_log_server = AccessLogServer()
+    access_log_server.start()
+    os.environ["NERCONE_WEBSITE_ACCESS_LOG_SOCKET"] = str(Files.Logs.access_socket)
+    # Workers keep their metrics snapshots here; a fresh supervisor starts every counter from zero.
+    shutil.rmtree(Directories.metrics, ignore_errors=True)
+    Directories.metrics.mkdir(parents=True, exist_ok=True)
+    os.environ["NERCONE_WEBSITE_METRICS_DIR"] = str(Directories.metrics)
+    try:
+        uvicorn.run("nercone_website.server:app", **options)
+    finally:
+        access_log_server.close()
+
+def prerender_thumbnails():
+    from .thumbnail import prerender_sitemap
+    count = asyncio.run(prerender_sitemap())
+    print(f"{count} thumbnails are ready in {Directories.caches.joinpath('thumbnails')}")
+
+def precompress():
+    from .compression import precompress_all, precompressed_dir
+    written, removed = precompress_all()
+    print(f"{written} precompressed files are ready in {precompressed_dir} ({removed} stale files removed)")
+
+def export(output: str):
+    from .export import export_site
+    manifest = asyncio.run(export_site(Path(output)))
+    print(f"{len(manifest['pages'])} pages, {len(manifest['files'])} files and {len(manifest['thumbnails'])} thumbnails are exported to {output} ({len(manifest['static'])} pages are static, {len(manifest['daily'])} show the daily quote, {len(manifest['proxy'])} routes still need the server)")
+    for note in manifest["notes"]:
+        print(f"note: {note}")
+
+def analyze(paths: list[str], since: str | None, until: str | None, top: int, max_keys: int, as_json: bool):
+    from datetime import datetime, timezone
+    from .analytics import analyze as analyze_logs, parse_time, format_report
+    now = datetime.now(timezone.utc)
+    analysis = analyze_logs([Path(path) for path in paths] or [Files.Logs.access], parse_time(since, now), parse_time(until, now), max_keys)
+    report = analysis.report(top)
+    print(json.dumps(report, ensure_ascii=False, indent=4) if as_json else format_report(report))
+
+startup_script = """
+import json, time, asyncio
+start = time.perf_counter()
+import nercone_website.server as server
+imported = (time.perf_counter() - start) * 1000
+
+async def startup():
+    async with server.app.router.lifespan_context(server.app):
+        pass
+
+asyncio.run(startup())
+print(json.dumps({"import": imported, "startup": server.startup_timings}))
+"""
+
+def startup_report(limit: int):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", startup_script], text=True, capture_output=True)
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        sys.exit(result.returncode)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|", 2)
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 2:
+            imports.append((int(cumulative_us) / 1000, int(self_us) / 1000, name.strip(), depth))
+
+    print("imports (cumulative / self ms)")
+    for cumulative, self_time, name, depth in sorted(imports, reverse=True)[:limit]:
+        print(f"  {cumulative:9.1f} {self_time:9.1f}  {'  ' * depth}{name}")
+    print("startup (ms)")
+    for name, duration in report["startup"].items():
+        print(f"  {duration:9.1f}  {name}")
+    print(f"total: {report['import']:.1f} ms import + {sum(report['startup'].values()):.1f} ms startup")
+
+def main():
+    parser = argparse.ArgumentParser(prog="nercone-website")
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser("serve", help="start the web server (default)")
+    serve_parser.add_argument("--workers", type=int, default=Server.workers, help="number of worker processes, 0 for one per CPU core")
+    subparsers.add_parser("thumbnails", help="pre-render thumbnails for every URL in sitemap.xml")
+    subparsers.add_parser("precompress", help="write .br/.gz copies of compressible files in public/ and remove stale ones")
+    export_parser = subparsers.add_parser("export", help="render every route to static files for nginx, with a manifest of routes that still need the server")
+    export_parser.add_argument("--output", default=str(Directories.base.joinpath("export")), help="output directory (replaced if it exists)")
+    analyze_parser = subparsers.add_parser("analyze", help="summarize access logs (counts, latency percentiles, stages, slow paths and hosts)")
+    analyze_parser.add_argument("paths", nargs="*", help="access log files, .gz allowed (default: logs/access.log)")
+    analyze_parser.add_argument("--since", help="start of the window, ISO 8601 or relative like 30m, 6h, 7d")
+    analyze_parser.add_argument("--until", help="end of the window, ISO 8601 or relative")
+    analyze_parser.add_argument("--top", type=int, default=20, help="number of paths and hosts to list")
+    analyze_parser.add_argument("--max-keys", type=int, default=10000, help="distinct paths and hosts tracked before the rest are merged into (other)")
+    analyze_parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    report_parser = subparsers.add_parser("startup-report", help="show where import and startup time goes")
+    report_parser.add_argument("--limit", type=int, default=25, help="number of imports to list")
+    args = parser.parse_args()
+
+    if args.command == "thumbnails":
+        prerender_thumbnails()
+    elif args.command == "precompress":
+        precompress()
+    elif args.command == "export":
+        export(args.output)
+    elif args.command == "analyze":
+        analyze(args.paths, args.since, args.until, args.top, args.max_keys, args.json)
+    elif args.command == "startup-report":
+        startup_report(args.limit)
+    else:
+        serve(getattr(args, "workers", Server.workers))
 
 if __name__ == "__main__":
     main()
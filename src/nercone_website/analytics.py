@@ -0,0 +1,211 @@
+import re
+import json
+import gzip
+import math
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+other = "(other)"
+timestamp_pattern = re.compile(rb'"timestamp": ?"([^"]+)"')
+relative_pattern = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+accuracy = 0.01
+gamma = (1 + accuracy) / (1 - accuracy)
+inverse_log_gamma = 1 / math.log(gamma)
+
+def bucket(value: float) -> int | None:
+    # Every sketch shares one gamma, so a duration is bucketed once and the index is reused by each sketch it lands in.
+    return math.ceil(math.log(value) * inverse_log_gamma) if value > 1e-6 else None
+
+class QuantileSketch:
+    # Log-bucketed sketch (as in DDSketch): every quantile is within `accuracy` relative error, memory grows with log(max/min).
+    def __init__(self):
+        self.buckets: dict[int | None, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value: float, index: int | None):
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.buckets.get(None, 0)
+        if rank < seen:
+            return 0.0
+        for index in sorted(index for index in self.buckets if index is not None):
+            seen += self.buckets[index]
+            if seen > rank:
+                return min(2 * gamma ** index / (gamma + 1), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 3) if self.count else 0.0,
+            "p50": round(self.quantile(0.50), 3),
+            "p90": round(self.quantile(0.90), 3),
+            "p99": round(self.quantile(0.99), 3),
+            "max": round(self.max, 3)
+        }
+
+class Group:
+    def __init__(self):
+        self.latency = QuantileSketch()
+        self.statuses: dict[str, int] = {}
+
+    def add(self, status: str, duration: float, index: int | None):
+        self.latency.add(duration, index)
+        statuses = self.statuses
+        statuses[status] = statuses.get(status, 0) + 1
+
+    def summary(self) -> dict:
+        return self.latency.summary() | {"total": round(self.latency.sum, 3), "statuses": dict(sorted(self.statuses.items()))}
+
+class Analysis:
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self.records = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.first: str | None = None
+        self.last: str | None = None
+        self.overall = Group()
+        self.paths: dict[str, Group] = {}
+        self.hosts: dict[str, Group] = {}
+        self.statuses: dict[str, QuantileSketch] = {}
+        self.stages: dict[str, QuantileSketch] = {}
+
+    def _group(self, groups: dict[str, Group], key: str) -> Group:
+        if (group := groups.get(key)) is None:
+            if len(groups) >= self.max_keys:
+                key = other
+            group = groups.setdefault(key, Group())
+        return group
+
+    def add(self, record: dict):
+        if "dropped" in record and "path" not in record:
+            self.dropped += record["dropped"]
+            return
+        try:
+            status = str(record["status_code"])
+            duration = float(record["duration"])
+            path = record["path"]
+            host = record.get("to", {}).get("host", "")
+        except (KeyError, TypeError, ValueError):
+            self.skipped += 1
+            return
+
+        self.records += 1
+        timestamp = record.get("timestamp")
+        if timestamp and (self.first is None or timestamp < self.first):
+            self.first = timestamp
+        if timestamp and (self.last is None or timestamp > self.last):
+            self.last = timestamp
+
+        index = bucket(duration)
+        self.overall.add(status, duration, index)
+        self._group(self.paths, path).add(status, duration, index)
+        self._group(self.hosts, host).add(status, duration, index)
+        if (sketch := self.statuses.get(status)) is None:
+            sketch = self.statuses[status] = QuantileSketch()
+        sketch.add(duration, index)
+        for stage, value in (record.get("timings") or {}).items():
+            if (sketch := self.stages.get(stage)) is None:
+                if len(self.stages) >= self.max_keys:
+                    continue
+                sketch = self.stages[stage] = QuantileSketch()
+            value = float(value)
+            sketch.add(value, bucket(value))
+
+    def report(self, top: int = 20) -> dict:
+        def slowest(groups: dict[str, Group]) -> list[dict]:
+            ranked = sorted(groups.items(), key=lambda item: item[1].latency.quantile(0.99), reverse=True)
+            return [{"key": key} | group.summary() for key, group in ranked[:top]]
+
+        def busiest(groups: dict[str, Group]) -> list[dict]:
+            ranked = sorted(groups.items(), key=lambda item: item[1].latency.sum, reverse=True)
+            return [{"key": key} | group.summary() for key, group in ranked[:top]]
+
+        total_stage_time = sum(sketch.sum for name, sketch in self.stages.items() if name != "total") or 1.0
+        return {
+            "window": {"first": self.first, "last": self.last},
+            "records": self.records,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "overall": self.overall.summary(),
+            "statuses": {status: sketch.summary() for status, sketch in sorted(self.statuses.items())},
+            "stages": {name: sketch.summary() | {"total": round(sketch.sum, 3), "share": round(sketch.sum / total_stage_time, 4) if name != "total" else None} for name, sketch in sorted(self.stages.items(), key=lambda item: item[1].sum, reverse=True)},
+            "paths": {"distinct": len(self.paths), "slowest": slowest(self.paths), "busiest": busiest(self.paths)},
+            "hosts": {"distinct": len(self.hosts), "slowest": slowest(self.hosts), "busiest": busiest(self.hosts)}
+        }
+
+def parse_time(value: str | None, now: datetime) -> str | None:
+    if not value:
+        return None
+    if match := relative_pattern.match(value):
+        moment = now - timedelta(seconds=float(match.group(1)) * units[match.group(2)])
+    else:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat()
+
+def read_lines(paths: list[Path]) -> Iterator[bytes]:
+    for path in paths:
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rb") as f:
+            yield from f
+
+def analyze(paths: list[Path], since: str | None = None, until: str | None = None, max_keys: int = 10000) -> Analysis:
+    # Timestamps are written by logger.log_access as UTC isoformat(), so window checks can compare the raw strings before decoding JSON.
+    analysis = Analysis(max_keys)
+    since_bytes = since.encode() if since else None
+    until_bytes = until.encode() if until else None
+    for line in read_lines(paths):
+        if since_bytes or until_bytes:
+            if match := timestamp_pattern.search(line, 0, 200):
+                timestamp = match.group(1)
+                if (since_bytes and timestamp < since_bytes) or (until_bytes and timestamp >= until_bytes):
+                    continue
+        try:
+            record = loads(line)
+        except ValueError:
+            analysis.skipped += 1
+            continue
+        if isinstance(record, dict):
+            analysis.add(record)
+        else:
+            analysis.skipped += 1
+    return analysis
+
+def format_report(report: dict) -> str:
+    def row(key: str, summary: dict) -> str:
+        return f"  {summary['count']:>9} {summary['p50']:>9.1f} {summary['p90']:>9.1f} {summary['p99']:>9.1f} {summary['max']:>10.1f}  {key}"
+
+    header = f"  {'count':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>10}"
+    lines = [
+        f"{report['records']} records from {report['window']['first']} to {report['window']['last']} ({report['skipped']} skipped, {report['dropped']} dropped by the writer)",
+        "", "overall", header, row("", report["overall"]),
+        "", "by status", header, *[row(status, summary) for status, summary in report["statuses"].items()],
+        "", "by stage", header, *[row(f"{stage}" + (f" ({summary['share']:.1%} of stage time)" if summary["share"] is not None else ""), summary) for stage, summary in report["stages"].items()]
+    ]
+    for name in ["paths", "hosts"]:
+        lines += ["", f"slowest {name} by p99 ({report[name]['distinct']} distinct)", header, *[row(entry["key"], entry) for entry in report[name]["slowest"]]]
+        lines += ["", f"{name} with the most total time", header, *[row(entry["key"], entry) for entry in report[name]["busiest"]]]
+    return "\n".join(lines)
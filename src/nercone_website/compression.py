@@ -0,0 +1,103 @@
+import os
+import gzip
+import asyncio
+import hashlib
+import brotli
+import threading
+import mimetypes
+from pathlib import Path
+from .config import Directories, Caches, Compression
+from .cache import LRUCache
+from .routes import route_index, FileInfo
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+compressible_types = ["text/", "application/json", "application/manifest+json", "application/xml", "application/javascript", "application/pgp-keys", "image/svg+xml"]
+minified_types = ["text/css", "text/javascript", "application/javascript", "image/svg+xml"] # compressed after minification in the middleware
+extensions = {"br": "br", "zstd": "zst", "gzip": "gz"}
+preference = ["br", "zstd", "gzip"] if zstandard else ["br", "gzip"]
+precompressed_dir = Directories.caches.joinpath("precompressed")
+
+compressed_cache = LRUCache(Caches.compressed)
+precompressed: dict[tuple[str, str], Path] = {}
+
+def is_compressible(content_type: str) -> bool:
+    return any(content_type.startswith(t) for t in compressible_types)
+
+def negotiate(accept_encoding: str) -> str | None:
+    qualities = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        params = params.strip()
+        try:
+            qualities[coding.strip()] = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            continue
+    default = qualities.get("*", 0.0)
+    candidates = [coding for coding in preference if qualities.get(coding, default) > 0]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda coding: qualities.get(coding, default))
+
+def compress(encoding: str, body: bytes, static: bool = False) -> bytes:
+    level = (Compression.static_levels if static else Compression.levels)[encoding]
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    elif encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+def compress_cached(encoding: str, body: bytes) -> tuple[bytes, bool]:
+    key = (encoding, hashlib.sha256(body).digest())
+    if (compressed := compressed_cache.get(key)) is not None:
+        return compressed, True
+    compressed = compress(encoding, body)
+    compressed_cache.set(key, compressed, size=len(compressed))
+    return compressed, False
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    return f'{etag[:-1]}-{encoding}"' if etag.endswith('"') else etag
+
+def static_content_type(name: str) -> str | None:
+    return mimetypes.guess_type(name)[0]
+
+def is_precompressible(name: str, info: FileInfo) -> bool:
+    content_type = static_content_type(name) or ""
+    return is_compressible(content_type) and not any(content_type.startswith(t) for t in minified_types) and info.size >= Compression.min_size
+
+def precompressed_path(name: str, info: FileInfo, encoding: str) -> Path:
+    return precompressed_dir.joinpath(f"{name}.{info.mtime_ns}-{info.size}.{extensions[encoding]}")
+
+def write_precompressed(name: str, info: FileInfo, encoding: str) -> Path:
+    path = precompressed_path(name, info, encoding)
+    if not path.is_file():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        tmp.write_bytes(compress(encoding, Directories.public.joinpath(name).read_bytes(), static=True))
+        tmp.replace(path)
+    precompressed[(name, encoding)] = path
+    return path
+
+async def get_precompressed(name: str, info: FileInfo, encoding: str) -> Path:
+    path = precompressed.get((name, encoding))
+    if path is not None and path == precompressed_path(name, info, encoding):
+        return path
+    return await asyncio.to_thread(write_precompressed, name, info, encoding)
+
+def precompress_all() -> tuple[int, int]:
+    route_index.build()
+    wanted = set()
+    for name, info in route_index.files.items():
+        if not name.endswith((".html", ".md")) and is_precompressible(name, info):
+            for encoding in preference:
+                wanted.add(write_precompressed(name, info, encoding))
+    removed = 0
+    if precompressed_dir.is_dir():
+        for path in precompressed_dir.rglob("*"):
+            if path.is_file() and path not in wanted:
+                path.unlink()
+                removed += 1
+    return len(wanted), removed
@@ -0,0 +1,45 @@
+import re
+import hashlib
+from typing import Mapping
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Response
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()[:32]}"'
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+encoding_suffix_pattern = re.compile(r'-(?:br|zstd|gzip)"$')
+
+def _opaque_tag(etag: str) -> str:
+    return encoding_suffix_pattern.sub('"', etag.strip().removeprefix("W/"))
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    opaque_tag = _opaque_tag(etag)
+    return any(_opaque_tag(candidate) in [opaque_tag, '"*"', "*"] for candidate in if_none_match.split(","))
+
+def is_not_modified(request_headers: Mapping[str, str], etag: str | None = None, last_modified: float | None = None) -> bool:
+    if if_none_match := request_headers.get("if-none-match"):
+        return etag is not None and etag_matches(if_none_match, etag)
+    if (if_modified_since := request_headers.get("if-modified-since")) and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def validator_headers(etag: str | None = None, last_modified: float | None = None) -> dict[str, str]:
+    headers = {}
+    if etag is not None:
+        headers["ETag"] = etag
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+def not_modified(etag: str | None = None, last_modified: float | None = None) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
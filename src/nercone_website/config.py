@@ -1,8 +1,7 @@
+import os
 import subprocess
 from pathlib import Path
 
-VERSION = subprocess.run(["/usr/bin/git", "rev-parse", "HEAD"], text=True, capture_output=True).stdout.strip()
-
 class Hostnames:
     local = ["localhost", "127.0.0.1"]
     normal = ["nercone.dev", "nerc1.dev", "diamondgotcat.net", "d-g-c.net"]
@@ -14,14 +13,121 @@ class Directories:
     public = base.joinpath("public")
     logs = base.joinpath("logs")
     databases = base.joinpath("databases")
+    caches = base.joinpath("caches")
+    profiles = logs.joinpath("profiles")
+    metrics = caches.joinpath("metrics")
 
 class Files:
     quotes = Directories.public.joinpath("quotes.txt")
     shorturls = Directories.public.joinpath("shorturls.json")
+    sitemap = Directories.public.joinpath("sitemap.xml")
+    version = Directories.base.joinpath("VERSION")
 
     class Logs:
         uvicorn = Directories.logs.joinpath("uvicorn.log")
         access = Directories.logs.joinpath("access.log")
+        access_socket = Directories.logs.joinpath("access.sock")
 
     class Databases:
         access_counter = Directories.databases.joinpath("access_counter.db")
+
+def read_version() -> str:
+    # update.sh writes VERSION at deploy time, so starting the server does not have to run git.
+    if version := os.environ.get("NERCONE_WEBSITE_VERSION", "").strip():
+        return version
+    try:
+        return Files.version.read_text(encoding="utf-8").strip()
+    except OSError:
+        pass
+    try:
+        return subprocess.run(["/usr/bin/git", "rev-parse", "HEAD"], text=True, capture_output=True).stdout.strip()
+    except OSError:
+        return ""
+
+VERSION = read_version()
+
+class Server:
+    # 0 starts one worker per CPU core.
+    workers = int(os.environ.get("NERCONE_WEBSITE_WORKERS", 1))
+
+class Caches:
+    pages = int(os.environ.get("NERCONE_WEBSITE_PAGE_CACHE_BYTES", 32 * 1024 * 1024))
+    markdowns = int(os.environ.get("NERCONE_WEBSITE_MARKDOWN_CACHE_BYTES", 16 * 1024 * 1024))
+    rendered = int(os.environ.get("NERCONE_WEBSITE_RENDERED_CACHE_BYTES", 32 * 1024 * 1024))
+    thumbnails = int(os.environ.get("NERCONE_WEBSITE_THUMBNAIL_CACHE_BYTES", 32 * 1024 * 1024))
+    minified = int(os.environ.get("NERCONE_WEBSITE_MINIFY_CACHE_BYTES", 16 * 1024 * 1024))
+    compressed = int(os.environ.get("NERCONE_WEBSITE_COMPRESS_CACHE_BYTES", 16 * 1024 * 1024))
+    dispatch = int(os.environ.get("NERCONE_WEBSITE_DISPATCH_CACHE_BYTES", 4 * 1024 * 1024))
+
+class Compression:
+    min_size = int(os.environ.get("NERCONE_WEBSITE_COMPRESS_MIN_BYTES", 1024))
+    max_buffer = int(os.environ.get("NERCONE_WEBSITE_COMPRESS_MAX_BUFFER_BYTES", 1024 * 1024))
+    # Rendered pages change on every request (access counter), so they are compressed at a cheaper level than precompressed files.
+    levels = {"br": 5, "zstd": 3, "gzip": 6}
+    static_levels = {"br": 11, "zstd": 19, "gzip": 9}
+
+class Proxy:
+    http2 = os.environ.get("NERCONE_WEBSITE_PROXY_HTTP2", "1") == "1"
+    max_connections = int(os.environ.get("NERCONE_WEBSITE_PROXY_MAX_CONNECTIONS", 100))
+    max_keepalive_connections = int(os.environ.get("NERCONE_WEBSITE_PROXY_MAX_KEEPALIVE_CONNECTIONS", 20))
+    keepalive_expiry = float(os.environ.get("NERCONE_WEBSITE_PROXY_KEEPALIVE_EXPIRY", 30))
+    connect_timeout = float(os.environ.get("NERCONE_WEBSITE_PROXY_CONNECT_TIMEOUT", 5))
+    timeout = float(os.environ.get("NERCONE_WEBSITE_PROXY_TIMEOUT", 30))
+
+class WebSockets:
+    max_size = int(os.environ.get("NERCONE_WEBSITE_WEBSOCKET_MAX_SIZE", 1024 * 1024))
+    max_queue = int(os.environ.get("NERCONE_WEBSITE_WEBSOCKET_MAX_QUEUE", 16))
+    write_limit = int(os.environ.get("NERCONE_WEBSITE_WEBSOCKET_WRITE_LIMIT", 64 * 1024))
+    compression = os.environ.get("NERCONE_WEBSITE_WEBSOCKET_COMPRESSION", "1") == "1"
+    open_timeout = float(os.environ.get("NERCONE_WEBSITE_WEBSOCKET_OPEN_TIMEOUT", 10))
+    ping_interval = float(os.environ.get("NERCONE_WEBSITE_WEBSOCKET_PING_INTERVAL", 20))
+
+class Profiling:
+    # Requests carrying this header with the secret as its value, from a private or loopback address, are run under cProfile.
+    header = b"x-nercone-profile"
+    secret = os.environ.get("NERCONE_WEBSITE_PROFILE_SECRET", "")
+    # Requests slower than this have their event loop stacks sampled from another thread; 0 disables it.
+    slow_threshold = float(os.environ.get("NERCONE_WEBSITE_PROFILE_SLOW_MS", 1000))
+    sample_interval = float(os.environ.get("NERCONE_WEBSITE_PROFILE_SAMPLE_INTERVAL_MS", 5))
+    max_files = int(os.environ.get("NERCONE_WEBSITE_PROFILE_MAX_FILES", 200))
+
+class Thumbnails:
+    workers = int(os.environ.get("NERCONE_WEBSITE_THUMBNAIL_WORKERS", 2))
+    # Served to clients that accept image/webp; needs Pillow (the webp extra).
+    webp = os.environ.get("NERCONE_WEBSITE_THUMBNAIL_WEBP", "1") == "1"
+    webp_quality = int(os.environ.get("NERCONE_WEBSITE_THUMBNAIL_WEBP_QUALITY", 85))
+    # Keys come from client-controlled query strings, so the disk cache is pruned (oldest first) beyond this many files.
+    max_disk_files = int(os.environ.get("NERCONE_WEBSITE_THUMBNAIL_MAX_DISK_FILES", 10000))
+
+class Limits:
+    # Concurrent expensive operations per route class, and how many may wait for a slot before new ones get a 503.
+    thumbnail = int(os.environ.get("NERCONE_WEBSITE_LIMIT_THUMBNAIL", Thumbnails.workers))
+    thumbnail_queue = int(os.environ.get("NERCONE_WEBSITE_LIMIT_THUMBNAIL_QUEUE", 32))
+    markdown = int(os.environ.get("NERCONE_WEBSITE_LIMIT_MARKDOWN", 4))
+    markdown_queue = int(os.environ.get("NERCONE_WEBSITE_LIMIT_MARKDOWN_QUEUE", 16))
+    svg = int(os.environ.get("NERCONE_WEBSITE_LIMIT_SVG", 1))
+    svg_queue = int(os.environ.get("NERCONE_WEBSITE_LIMIT_SVG_QUEUE", 8))
+    wait_timeout = float(os.environ.get("NERCONE_WEBSITE_LIMIT_WAIT_TIMEOUT", 10))
+    retry_after = int(os.environ.get("NERCONE_WEBSITE_LIMIT_RETRY_AFTER", 5))
+
+class Monitoring:
+    # /metrics answers only requests for a local hostname from a private or loopback address, and with this token as a Bearer token if set.
+    # The onion service and nginx both connect from 127.0.0.1, so the address alone does not keep it private.
+    token = os.environ.get("NERCONE_WEBSITE_METRICS_TOKEN", "")
+    directory = os.environ.get("NERCONE_WEBSITE_METRICS_DIR") or None # set by the supervisor when running multiple workers
+
+class Intervals:
+    # Increments are kept in memory between flushes, so a crash loses the ones since the last successful flush:
+    # at most this many seconds of them while flushes succeed. Failed flushes are logged and retried on the next interval.
+    access_counter_flush = float(os.environ.get("NERCONE_WEBSITE_ACCESS_COUNTER_FLUSH_INTERVAL", 5))
+    access_log_flush = float(os.environ.get("NERCONE_WEBSITE_ACCESS_LOG_FLUSH_INTERVAL", 1))
+    metrics_snapshot = float(os.environ.get("NERCONE_WEBSITE_METRICS_SNAPSHOT_INTERVAL", 5))
+
+class AccessLog:
+    queue_size = int(os.environ.get("NERCONE_WEBSITE_ACCESS_LOG_QUEUE_SIZE", 10000))
+    batch_size = int(os.environ.get("NERCONE_WEBSITE_ACCESS_LOG_BATCH_SIZE", 256))
+    full_policy = os.environ.get("NERCONE_WEBSITE_ACCESS_LOG_FULL_POLICY", "count") # block, drop or count
+    max_bytes = int(os.environ.get("NERCONE_WEBSITE_ACCESS_LOG_MAX_BYTES", 256 * 1024 * 1024))
+    rotate_daily = os.environ.get("NERCONE_WEBSITE_ACCESS_LOG_ROTATE_DAILY", "0") == "1"
+    compress = os.environ.get("NERCONE_WEBSITE_ACCESS_LOG_COMPRESS", "1") == "1"
+    socket = os.environ.get("NERCONE_WEBSITE_ACCESS_LOG_SOCKET") or None # set by the supervisor when running multiple workers
@@ -0,0 +1,79 @@
+import json
+import random
+import logging
+from pathlib import Path
+from datetime import datetime, timezone
+from .config import Files
+
+logger = logging.getLogger(__name__)
+
+class ShortURLs:
+    max_depth = 10
+
+    def __init__(self, path: Path = Files.shorturls):
+        self.path = path
+        self.targets: dict[str, str] | None = None
+        self.error: Exception | None = None
+
+    def load(self):
+        self.targets = {}
+        self.error = None
+        if not self.path.is_file():
+            self.error = FileNotFoundError(self.path)
+            return
+        try:
+            entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception:
+            self.error = ValueError(self.path)
+            return
+        self.targets = self.flatten(entries)
+
+    def flatten(self, entries: dict) -> dict[str, str]:
+        targets = {}
+        for shorturl_id in entries:
+            current_id = shorturl_id
+            visited = []
+            for _ in range(self.max_depth):
+                if current_id in visited:
+                    logger.warning("short URL %r has an alias cycle: %s", shorturl_id, " -> ".join(visited + [current_id]))
+                    break
+                if current_id not in entries:
+                    logger.warning("short URL %r points to an unknown id %r", shorturl_id, current_id)
+                    break
+                visited.append(current_id)
+                entry = entries[current_id]
+                if not isinstance(entry, dict) or entry.get("type") not in ["redirect", "alias"] or "content" not in entry:
+                    logger.warning("short URL %r has an invalid entry %r", shorturl_id, current_id)
+                    break
+                if entry["type"] == "redirect":
+                    targets[shorturl_id] = entry["content"]
+                    break
+                current_id = entry["content"]
+            else:
+                logger.warning("short URL %r exceeds the alias depth limit of %d", shorturl_id, self.max_depth)
+        return targets
+
+    def resolve(self, full_path: str) -> str | None:
+        if self.targets is None:
+            self.load()
+        if self.error:
+            raise self.error
+        return self.targets.get(full_path.strip().rstrip("/"))
+
+class Quotes:
+    def __init__(self, path: Path = Files.quotes):
+        self.path = path
+        self.quotes: list[str] | None = None
+        self.daily_quote: tuple[str, str] | None = None
+
+    def load(self):
+        self.quotes = self.path.read_text(encoding="utf-8").strip().split("\n")
+        self.daily_quote = None
+
+    def daily(self) -> str:
+        seed = str(datetime.now(timezone.utc).date())
+        if self.daily_quote is None or self.daily_quote[0] != seed:
+            if self.quotes is None:
+                self.load()
+            self.daily_quote = (seed, random.Random(seed).choice(self.quotes))
+        return self.daily_quote[1]
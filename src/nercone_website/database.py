@@ -1,60 +1,97 @@
+import asyncio
+import logging
 import sqlite3
-from .config import Files
+import threading
+from pathlib import Path
+from .config import Files, Intervals
+
+logger = logging.getLogger(__name__)
 
 class AccessCounter:
-    def get(self) -> int:
-        if Files.Databases.access_counter.is_file():
-            conn = sqlite3.connect(Files.Databases.access_counter)
-            try:
-                cur = conn.cursor()
-                cur.execute("SELECT value FROM access_counter WHERE rowid = 1")
-                row = cur.fetchone()
-                if row is None:
-                    conn.execute("""
-                    CREATE TABLE IF NOT EXISTS access_counter (
-                        value INTEGER NOT NULL
-                    )
-                    """)
-                    conn.execute("INSERT OR IGNORE INTO access_counter (rowid, value) VALUES (1, 0)")
-                    conn.commit()
-                    return 0
-                return row[0]
-            finally:
-                conn.close()
-        else:
-            conn = sqlite3.connect(Files.Databases.access_counter)
+    def __init__(self, path: Path = Files.Databases.access_counter):
+        self.path = path
+        self.connection: sqlite3.Connection | None = None
+        self.count = 0
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.task: asyncio.Task | None = None
+
+    def open(self):
+        with self.db_lock:
+            if self.connection is not None:
+                return
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
             conn.execute("""
             CREATE TABLE IF NOT EXISTS access_counter (
                 value INTEGER NOT NULL
             )
             """)
             conn.execute("INSERT OR IGNORE INTO access_counter (rowid, value) VALUES (1, 0)")
-            conn.commit()
-            conn.close()
-            return 0
+            value = conn.execute("SELECT value FROM access_counter WHERE rowid = 1").fetchone()[0]
+            with self.lock:
+                self.count = value + self.pending
+            self.connection = conn
+
+    def get(self) -> int:
+        if self.connection is None:
+            self.open()
+        return self.count
 
     def increase(self):
-        if Files.Databases.access_counter.is_file():
-            conn = sqlite3.connect(Files.Databases.access_counter)
+        if self.connection is None:
+            self.open()
+        with self.lock:
+            self.count += 1
+            self.pending += 1
+
+    def flush(self):
+        if self.connection is None:
+            self.open()
+        with self.db_lock:
+            with self.lock:
+                pending, self.pending = self.pending, 0
             try:
-                cur = conn.cursor()
-                conn.execute("BEGIN IMMEDIATE")
-                cur.execute(
-                    "UPDATE access_counter SET value = value + 1 WHERE rowid = 1"
-                )
-                conn.commit()
+                self.connection.execute("BEGIN IMMEDIATE")
+                if pending:
+                    self.connection.execute("UPDATE access_counter SET value = value + ? WHERE rowid = 1", (pending,))
+                value = self.connection.execute("SELECT value FROM access_counter WHERE rowid = 1").fetchone()[0]
+                self.connection.execute("COMMIT")
             except Exception:
-                conn.rollback()
+                if self.connection.in_transaction:
+                    self.connection.execute("ROLLBACK")
+                with self.lock:
+                    self.pending += pending
                 raise
-            finally:
-                conn.close()
-        else:
-            conn = sqlite3.connect(Files.Databases.access_counter)
-            conn.execute("""
-            CREATE TABLE IF NOT EXISTS access_counter (
-                value INTEGER NOT NULL
-            )
-            """)
-            conn.execute("INSERT OR IGNORE INTO access_counter (rowid, value) VALUES (1, 1)")
-            conn.commit()
-            conn.close()
+            with self.lock:
+                self.count = value + self.pending
+
+    async def run(self, interval: float = Intervals.access_counter_flush):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                # flush() has already put the increments back, so they go out with the next successful flush.
+                logger.exception("failed to flush the access counter (%d increments pending)", self.pending)
+
+    def start(self):
+        self.open()
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.connection is not None:
+            self.flush()
+            with self.db_lock:
+                self.connection.close()
+                self.connection = None
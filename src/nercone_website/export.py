@@ -0,0 +1,134 @@
+import re
+import json
+import shutil
+import httpx
+import posixpath
+from html import unescape
+from pathlib import Path
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+from .config import VERSION, Directories, Compression
+from .routes import route_index
+from .compression import preference, extensions, is_compressible, compress, static_content_type
+from .middleware import minify_kind
+from . import thumbnail as thumbnails
+
+partials = ["base.html", "error.html"]
+dynamic_globals = {"get_access_count": "access_count", "get_daily_quote": "daily_quote"}
+og_image_pattern = re.compile(r'<meta property="og:image" content="([^"]*)"')
+
+def page_url(name: str) -> str:
+    stem = posixpath.splitext(name)[0]
+    if posixpath.basename(stem) in ["index", "README"]:
+        stem = posixpath.dirname(stem)
+    return f"/{stem}/" if stem else "/"
+
+def page_urls() -> list[str]:
+    urls = []
+    for name in route_index.files:
+        if name.endswith((".html", ".md")) and name not in partials and (url := page_url(name)) not in urls:
+            urls.append(url)
+    return urls
+
+def write(output: Path, name: str, content: bytes, written: list[Path]):
+    path = output.joinpath(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    written.append(path)
+
+def write_precompressed(path: Path):
+    content_type = static_content_type(path.name) or ""
+    if not is_compressible(content_type) or path.stat().st_size < Compression.min_size:
+        return
+    body = path.read_bytes()
+    for encoding in preference:
+        path.with_name(f"{path.name}.{extensions[encoding]}").write_bytes(compress(encoding, body, static=True))
+
+async def export_site(output: Path) -> dict:
+    from .server import app, templates, shorturls
+
+    async def prerender_app(scope, receive, send):
+        await app(dict(scope, prerender=True), receive, send)
+
+    route_index.build()
+    shorturls.load()
+    if output.exists():
+        shutil.rmtree(output)
+    output.mkdir(parents=True)
+
+    used: set[str] = set()
+    originals = {name: templates.env.globals[name] for name in dynamic_globals}
+    def tracked(name: str):
+        def wrapper(*args, **kwargs):
+            used.add(dynamic_globals[name])
+            return originals[name](*args, **kwargs)
+        return wrapper
+    templates.env.globals.update({name: tracked(name) for name in dynamic_globals})
+
+    written: list[Path] = []
+    # static: pages nginx can serve as written; daily: pages embedding the daily quote, to be re-exported every day unless proxied;
+    # proxy: routes that must go to the server, including every page that shows the access count.
+    manifest = {"version": VERSION, "generated": datetime.now(timezone.utc).isoformat(), "pages": {}, "static": [], "daily": [], "files": [], "thumbnails": {}, "redirects": {}, "proxy": [], "notes": []}
+    headers = {"accept-encoding": "identity", "user-agent": "nercone-website-export"}
+    transport = httpx.ASGITransport(app=prerender_app, client=("127.0.0.1", 0))
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://nercone.dev") as client:
+            for url in page_urls():
+                page = {}
+                for variant, extra_headers in [("html", {}), ("markdown", {"accept": "text/markdown"})]:
+                    used.clear()
+                    response = await client.get(url, headers=headers | extra_headers)
+                    if response.status_code != 200:
+                        continue
+                    name = f"{url.strip('/')}/index.{'md' if variant == 'markdown' else 'html'}".lstrip("/")
+                    write(output, name, response.content, written)
+                    page[variant] = {"file": name, "dynamic": sorted(used)}
+
+                    if variant == "html" and (match := og_image_pattern.search(response.text)):
+                        image_url = urlsplit(unescape(match.group(1)))
+                        query = {k: v[0] for k, v in parse_qs(image_url.query).items()}
+                        path = image_url.path.split("/images/thumbnails/", 1)[-1]
+                        template_type = query.get("template", "normal")
+                        title = query.get("title", "Untitled Page")
+                        description = query.get("description", "No description.")
+                        png = await thumbnails.get_thumbnail(thumbnails.thumbnail_key(template_type, path, title, description), template_type, path, title, description)
+                        thumbnail_name = f"assets/images/thumbnails/{path or 'index'}.png"
+                        write(output, thumbnail_name, png, written)
+                        manifest["thumbnails"][image_url.path] = thumbnail_name
+                if page:
+                    manifest["pages"][url] = page
+                    dynamic = {name for variant in page.values() for name in variant["dynamic"]}
+                    if "access_count" in dynamic:
+                        manifest["proxy"].append(url)
+                    if "daily_quote" in dynamic:
+                        manifest["daily"].append(url)
+                    if not dynamic & {"access_count", "daily_quote"}:
+                        manifest["static"].append(url)
+
+            for name in route_index.files:
+                if name.endswith((".html", ".md")):
+                    continue
+                if minify_kind(static_content_type(name) or ""):
+                    response = await client.get(f"/{name}", headers=headers)
+                    write(output, name, response.content, written)
+                else:
+                    path = output.joinpath(name)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copy2(Directories.public.joinpath(name), path)
+                    written.append(path)
+                manifest["files"].append(name)
+    finally:
+        templates.env.globals.update(originals)
+        thumbnails.shutdown()
+
+    for path in written:
+        write_precompressed(path)
+
+    if proxied := [url for url in manifest["proxy"] if url in manifest["pages"]]:
+        manifest["notes"].append(f"{len(proxied)} of {len(manifest['pages'])} pages show the access count (base.html calls get_access_count() on every page that extends it), so their HTML cannot be served by nginx; only assets, thumbnails, redirects and the pages in \"static\" can be offloaded.")
+    if manifest["daily"]:
+        manifest["notes"].append("Pages listed in \"daily\" embed the daily quote as of this export; re-export them every day (UTC) unless they are also in \"proxy\".")
+    manifest["redirects"] = {f"/{shorturl}": target for shorturl, target in shorturls.targets.items()}
+    manifest["proxy"] += sorted({route.path for route in app.routes if getattr(route, "endpoint", None) and route.path != "/{full_path:path}" and not route.path.startswith("/assets/images/thumbnails/")})
+    output.joinpath("manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=4) + "\n", encoding="utf-8")
+    return manifest
@@ -0,0 +1,112 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from .config import Limits
+
+class Overloaded(Exception):
+    def __init__(self, limiter: str):
+        super().__init__(limiter)
+        self.limiter = limiter
+
+class Limiter:
+    # Per-process and per-loop: at most `concurrency` holders, at most `queue` waiters, waiters give up after `timeout` seconds.
+    def __init__(self, name: str, concurrency: int, queue: int, timeout: float = Limits.wait_timeout):
+        self.name = name
+        self.concurrency = max(concurrency, 1)
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.stale = 0
+
+    async def acquire(self):
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self.waiters) >= self.queue:
+            self.rejected += 1
+            raise Overloaded(self.name)
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._forget(future)
+            self.timed_out += 1
+            raise Overloaded(self.name)
+        except asyncio.CancelledError:
+            # release() may already have handed the slot over before the cancellation arrived.
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self._forget(future)
+            raise
+        self.admitted += 1
+
+    def release(self):
+        # The slot passes straight to the next live waiter, so `active` only drops when nobody is waiting.
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _forget(self, future: asyncio.Future):
+        try:
+            self.waiters.remove(future)
+        except ValueError:
+            pass
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue": self.queue,
+            "active": self.active,
+            "waiting": len(self.waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "stale": self.stale
+        }
+
+limiters = {
+    "thumbnail": Limiter("thumbnail", Limits.thumbnail, Limits.thumbnail_queue),
+    "markdown-mode": Limiter("markdown-mode", Limits.markdown, Limits.markdown_queue),
+    "svg-minify": Limiter("svg-minify", Limits.svg, Limits.svg_queue)
+}
+
+def stats() -> dict:
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+def render(limiter_stats: dict[str, dict] | None = None) -> str:
+    if limiter_stats is None:
+        limiter_stats = stats()
+    lines = [
+        "# HELP nercone_website_limiter_requests_total Expensive operations by limiter and outcome (admitted, rejected, timed_out or stale).",
+        "# TYPE nercone_website_limiter_requests_total counter"
+    ]
+    for name, limiter in limiter_stats.items():
+        for outcome in ["admitted", "rejected", "timed_out", "stale"]:
+            lines.append(f'nercone_website_limiter_requests_total{{limiter="{name}",outcome="{outcome}"}} {limiter[outcome]}')
+    for gauge, help_text in [("active", "Operations currently holding a slot."), ("waiting", "Operations waiting for a slot.")]:
+        lines += [f"# HELP nercone_website_limiter_{gauge} {help_text}", f"# TYPE nercone_website_limiter_{gauge} gauge"]
+        for name, limiter in limiter_stats.items():
+            lines.append(f'nercone_website_limiter_{gauge}{{limiter="{name}"}} {limiter[gauge]}')
+    return "\n".join(lines) + "\n"
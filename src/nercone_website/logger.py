@@ -1,9 +1,19 @@
+import gzip
 import time
 import uuid
 import json
+import queue
+import atexit
+import shutil
+import socket
+import logging
+import threading
+from pathlib import Path
 from starlette.types import Scope
 from datetime import datetime, timezone
-from .config import Files
+from .config import Files, AccessLog, Intervals, Profiling
+
+logger = logging.getLogger(__name__)
 
 def log_access(scope: Scope, write: bool = False) -> tuple[dict, float]:
     client = scope.get("client") or ("", 0)
@@ -24,7 +34,7 @@ def log_access(scope: Scope, write: bool = False) -> tuple[dict, float]:
         },
         "method": scope.get("method", "GET"),
         "path": scope.get("path", "/"),
-        "headers": {k.decode(): v.decode() for k, v in headers.items()}
+        "headers": {k.decode(): "(redacted)" if k == Profiling.header else v.decode() for k, v in headers.items()}
     }
     if write:
         write_log(log)
@@ -39,6 +49,189 @@ def finalize_log(log: dict, status_code: int, start_time: float, timings: dict |
         write_log(log)
     return log
 
+class AccessLogWriter:
+    def __init__(self, path: Path = Files.Logs.access, socket_path: str | None = AccessLog.socket):
+        self.path = path
+        self.socket_path = socket_path
+        self.socket: socket.socket | None = None
+        self.queue: queue.Queue[str | None] = queue.Queue(maxsize=AccessLog.queue_size)
+        self.thread: threading.Thread | None = None
+        self.lock = threading.Lock()
+        self.file = None
+        self.opened_date = None
+        self.written = 0
+        self.dropped = 0
+        self.unreported_drops = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name="access-log-writer", daemon=True)
+            self.thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is None:
+            return
+        self.queue.put(None)
+        thread.join()
+
+    def write(self, log: dict):
+        self.write_line(json.dumps(log, ensure_ascii=False) + "\n")
+
+    def write_line(self, line: str):
+        if self.thread is None:
+            self.start()
+        if AccessLog.full_policy == "block":
+            self.queue.put(line)
+            return
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+                if AccessLog.full_policy == "count":
+                    self.unreported_drops += 1
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + Intervals.access_log_flush
+        while True:
+            try:
+                line = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                line = ""
+            if line is None:
+                self._write_batch(batch)
+                if self.file is not None:
+                    self.file.close()
+                    self.file = None
+                if self.socket is not None:
+                    self.socket.close()
+                    self.socket = None
+                return
+            if line:
+                batch.append(line)
+            if len(batch) >= AccessLog.batch_size or time.monotonic() >= deadline:
+                self._write_batch(batch)
+                batch = []
+                deadline = time.monotonic() + Intervals.access_log_flush
+
+    def _write_batch(self, batch: list[str]):
+        with self.lock:
+            drops, self.unreported_drops = self.unreported_drops, 0
+        lines = batch + [json.dumps({"timestamp": datetime.now(timezone.utc).isoformat(), "dropped": drops}) + "\n"] if drops else batch
+        if not lines:
+            return
+        if self.socket_path is not None:
+            self._send_batch(lines)
+            return
+        try:
+            self._rotate_if_needed()
+            self.file.writelines(lines)
+            self.file.flush()
+            self.written += len(lines)
+        except Exception:
+            # The writer thread has to survive a full disk or a broken logs/ directory; the file is reopened for the next batch.
+            logger.exception("failed to write %d access log records to %s", len(batch), self.path)
+            if self.file is not None:
+                try:
+                    self.file.close()
+                except OSError:
+                    pass
+                self.file = None
+            with self.lock:
+                self.dropped += len(batch)
+                if AccessLog.full_policy == "count":
+                    self.unreported_drops += len(batch) + drops
+
+    def _send_batch(self, batch: list[str]):
+        data = "".join(batch).encode("utf-8")
+        for _ in range(2):
+            try:
+                if self.socket is None:
+                    self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self.socket.connect(self.socket_path)
+                self.socket.sendall(data)
+                self.written += len(batch)
+                return
+            except OSError:
+                if self.socket is not None:
+                    self.socket.close()
+                    self.socket = None
+        with self.lock:
+            self.dropped += len(batch)
+            if AccessLog.full_policy == "count":
+                self.unreported_drops += len(batch)
+
+    def _rotate_if_needed(self):
+        today = datetime.now(timezone.utc).date()
+        if self.file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.file = self.path.open("a", encoding="utf-8")
+            self.opened_date = datetime.fromtimestamp(self.path.stat().st_mtime, timezone.utc).date() if self.file.tell() else today
+        too_large = AccessLog.max_bytes > 0 and self.file.tell() >= AccessLog.max_bytes
+        new_day = AccessLog.rotate_daily and self.opened_date != today
+        if not (too_large or new_day) or self.file.tell() == 0:
+            return
+
+        self.file.close()
+        rotated = self.path.with_name(f"{self.path.name}.{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}")
+        suffix = 0
+        while rotated.exists() or rotated.with_name(rotated.name + ".gz").exists():
+            suffix += 1
+            rotated = rotated.with_name(f"{self.path.name}.{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.{suffix}")
+        self.path.rename(rotated)
+        if AccessLog.compress:
+            with rotated.open("rb") as src, gzip.open(rotated.with_name(rotated.name + ".gz"), "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            rotated.unlink()
+        self.file = self.path.open("a", encoding="utf-8")
+        self.opened_date = today
+
+class AccessLogServer:
+    def __init__(self, socket_path: Path = Files.Logs.access_socket, path: Path = Files.Logs.access):
+        self.socket_path = socket_path
+        self.writer = AccessLogWriter(path, socket_path=None)
+        self.socket: socket.socket | None = None
+
+    def start(self):
+        self.writer.start()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self.socket_path.unlink(missing_ok=True)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.bind(str(self.socket_path))
+        self.socket.listen()
+        threading.Thread(target=self._accept, name="access-log-server", daemon=True).start()
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+            self.socket_path.unlink(missing_ok=True)
+        self.writer.close()
+
+    def _accept(self):
+        while self.socket is not None:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._receive, args=(connection,), name="access-log-receiver", daemon=True).start()
+
+    def _receive(self, connection: socket.socket):
+        with connection, connection.makefile("r", encoding="utf-8") as lines:
+            for line in lines:
+                if line.endswith("\n"): # a worker that died mid-send leaves a truncated last line
+                    self.writer.write_line(line)
+
+writer = AccessLogWriter()
+
 def write_log(log: dict) -> None:
-    with Files.Logs.access.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(log, ensure_ascii=False) + "\n")
+    writer.write(log)
@@ -0,0 +1,135 @@
+import os
+import json
+import bisect
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from starlette.types import Scope
+from .config import Monitoring, Intervals
+from .limits import stats as limits_stats, render as render_limits
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in milliseconds, matching the units of the middleware timings.
+buckets = [0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+def set_route(scope: Scope, route: str):
+    if (log := scope.get("log")) is not None:
+        log["route"] = route
+
+def status_class(status_code: int | None) -> str:
+    return f"{status_code // 100}xx" if status_code else "none"
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(buckets, value)] += 1
+        self.sum += value
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests: dict[tuple[str, str], int] = {}
+        self.histograms: dict[tuple[str, str, str], Histogram] = {}
+
+    def observe(self, route: str | None, status_code: int | None, timings: dict[str, float]):
+        labels = (route or ("error" if status_code and status_code >= 400 else "other"), status_class(status_code))
+        with self.lock:
+            self.requests[labels] = self.requests.get(labels, 0) + 1
+            for phase, value in timings.items():
+                if (histogram := self.histograms.get(labels + (phase,))) is None:
+                    histogram = self.histograms[labels + (phase,)] = Histogram()
+                histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "requests": [[*labels, count] for labels, count in self.requests.items()],
+                "histograms": [[*labels, list(histogram.counts), histogram.sum] for labels, histogram in self.histograms.items()]
+            }
+
+def render(snapshot: dict) -> str:
+    lines = [
+        "# HELP nercone_website_requests_total Requests handled, by route class and status class.",
+        "# TYPE nercone_website_requests_total counter"
+    ]
+    for route, status, count in sorted(snapshot["requests"]):
+        lines.append(f'nercone_website_requests_total{{route="{route}",status="{status}"}} {count}')
+
+    lines += [
+        "# HELP nercone_website_request_duration_seconds Time spent in each phase of a request, as reported in Server-Timing.",
+        "# TYPE nercone_website_request_duration_seconds histogram"
+    ]
+    for route, status, phase, counts, total in sorted(snapshot["histograms"]):
+        labels = f'route="{route}",status="{status}",phase="{phase}"'
+        cumulative = 0
+        for bound, count in zip(buckets + ["+Inf"], counts):
+            cumulative += count
+            le = bound if bound == "+Inf" else f"{bound / 1000:g}"
+            lines.append(f'nercone_website_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"nercone_website_request_duration_seconds_sum{{{labels}}} {total / 1000:.6f}")
+        lines.append(f"nercone_website_request_duration_seconds_count{{{labels}}} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+# With several workers a scrape reaches only one of them, so every worker keeps a snapshot in Monitoring.directory
+# and /metrics adds them all up. Snapshots of exited workers stay, so counters never go backwards; their gauges are left out.
+def snapshot_path(pid: int) -> Path:
+    return Path(Monitoring.directory).joinpath(f"{pid}.json")
+
+def write_snapshot():
+    path = snapshot_path(os.getpid())
+    temporary = path.with_name(f"{path.name}.tmp")
+    temporary.write_text(json.dumps({"metrics": metrics.snapshot(), "limits": limits_stats()}), encoding="utf-8")
+    temporary.replace(path)
+
+async def publish(interval: float = Intervals.metrics_snapshot):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(write_snapshot)
+        except OSError:
+            logger.exception("failed to write the metrics snapshot")
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def collect() -> str:
+    if Monitoring.directory is None:
+        return render(metrics.snapshot()) + render_limits()
+    write_snapshot()
+    requests: dict[tuple, int] = {}
+    histograms: dict[tuple, list] = {}
+    limiters: dict[str, dict] = {}
+    for path in Path(Monitoring.directory).glob("*.json"):
+        try:
+            snapshot = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        for *labels, count in snapshot["metrics"]["requests"]:
+            requests[tuple(labels)] = requests.get(tuple(labels), 0) + count
+        for *labels, counts, total in snapshot["metrics"]["histograms"]:
+            merged = histograms.setdefault(tuple(labels), [[0] * len(counts), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+        alive = is_alive(int(path.stem))
+        for name, stats in snapshot["limits"].items():
+            merged = limiters.setdefault(name, dict.fromkeys(stats, 0))
+            for key, value in stats.items():
+                if key not in ["active", "waiting"] or alive:
+                    merged[key] += value
+    return render({
+        "requests": [[*labels, count] for labels, count in requests.items()],
+        "histograms": [[*labels, counts, total] for labels, (counts, total) in histograms.items()]
+    }) + render_limits(limiters)
@@ -1,16 +1,89 @@
 import time
+import asyncio
+import hashlib
 import rjsmin
 import rcssmin
-from scour import scour
+from pathlib import Path
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 from fastapi import Response
 from fastapi.responses import PlainTextResponse
-from starlette.types import Scope, ASGIApp, Receive, Send
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import Scope, ASGIApp, Receive, Send, Message
 from .logger import log_access, finalize_log
-from .config import VERSION, Hostnames
+from .config import VERSION, Hostnames, Caches, Compression
+from .cache import LRUCache
+from .conditional import make_etag, is_not_modified
+from .metrics import metrics
+from .limits import limiters, Overloaded
+from .profiling import requested as profile_requested, start_profile, stop_profile, tag_response, write_profile, write_stacks, sampler
+from .compression import is_compressible, negotiate, compress, compress_cached, encoded_etag
+
+scour_options = None
+
+minify_cache = LRUCache(Caches.minified)
+dispatch_cache = LRUCache(Caches.dispatch)
+scour_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scour") # scour keeps module-level state, so every call runs on this one thread and NERCONE_WEBSITE_LIMIT_SVG above 1 only lets more requests wait for it
+
+def minify_kind(content_type: str) -> str | None:
+    if "text/css" in content_type:
+        return "css"
+    elif any(content_type.startswith(t) for t in ["text/javascript", "application/javascript"]):
+        return "js"
+    elif "image/svg+xml" in content_type:
+        return "svg"
+    return None
+
+def get_scour():
+    global scour_options
+    from scour import scour
+    if scour_options is None:
+        options = scour.generateDefaultOptions()
+        options.newlines = False
+        options.shorten_ids = True
+        options.strip_comments = True
+        scour_options = options
+    return scour, scour_options
+
+def minify(kind: str, body: bytes) -> tuple[bytes, bool]:
+    key = (kind, hashlib.sha256(body).digest())
+    if (minified := minify_cache.get(key)) is not None:
+        return minified, True
+
+    minified = body
+    try:
+        if kind == "css":
+            minified = rcssmin.cssmin(body.decode("utf-8", errors="replace")).encode("utf-8")
+        elif kind == "js":
+            minified = rjsmin.jsmin(body.decode("utf-8", errors="replace")).encode("utf-8")
+        elif kind == "svg":
+            scour, options = get_scour()
+            minified = scour.scourString(body.decode("utf-8", errors="replace"), options).encode("utf-8")
+    except Exception:
+        pass
+    minify_cache.set(key, minified, size=len(minified))
+    return minified, False
+
+async def minify_async(kind: str, body: bytes) -> tuple[bytes, str]:
+    # css/js minifiers are fast C extensions; scour is slow enough to stall the loop, so misses go to its own thread.
+    if kind != "svg":
+        minified, hit = minify(kind, body)
+        return minified, "hit" if hit else "miss"
+    if (minified := minify_cache.get((kind, hashlib.sha256(body).digest()))) is not None:
+        return minified, "hit"
+    try:
+        async with limiters["svg-minify"].slot():
+            minified, hit = await asyncio.get_running_loop().run_in_executor(scour_executor, minify, kind, body)
+    except Overloaded:
+        return body, "skipped"
+    return minified, "hit" if hit else "miss"
 
 class Middleware:
-    def __init__(self, app: ASGIApp):
+    def __init__(self, app: ASGIApp, route_exists: Callable[[str], bool] = lambda path: True, streams_body: Callable[[str], bool] = lambda path: False):
         self.app = app
+        self.route_exists = route_exists
+        self.streams_body = streams_body
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send):
         if scope["type"] not in ("http", "websocket"):
@@ -41,65 +114,139 @@ class Middleware:
         if not any([hostname.endswith(candidate) for candidate in Hostnames.all]):
             response = PlainTextResponse("許可されていないホスト名でのアクセスです。", status_code=400)
             await self._send(response, scope, receive, send, timings, request_start)
-            finalize_log(scope["log"], response.status_code, request_start, timings)
+            self._finish(scope, response.status_code, request_start, timings)
             return
 
-        recv_start = time.perf_counter()
-        body = await self._read_body(receive)
-        timings["recv"] = (time.perf_counter() - recv_start) * 1000
-        async def cached_receive():
-            return {"type": "http.request", "body": body, "more_body": False}
-
-        if subdomain not in ["", "www"]:
-            original_path = scope["path"] if scope["path"].strip() else "/"
-            subdomain_path = f"/{'/'.join(subdomain.split('.')[::-1])}{original_path}"
-
-            response = await self._get_response(scope, cached_receive, subdomain_path, timings, "app")
-            if response.status_code < 400:
-                await self._send(response, scope, cached_receive, send, timings, request_start)
-                finalize_log(scope["log"], response.status_code, request_start, timings)
-                return
-
-            response = await self._get_response(scope, cached_receive, original_path, timings, "app-retry")
-            await self._send(response, scope, cached_receive, send, timings, request_start)
-            finalize_log(scope["log"], response.status_code, request_start, timings)
-        else:
-            response = await self._get_response(scope, cached_receive, scope["path"], timings, "app")
-            await self._send(response, scope, cached_receive, send, timings, request_start)
-            finalize_log(scope["log"], response.status_code, request_start, timings)
+        path = self._resolve_path(subdomain, scope["path"])
+        # Proxied routes relay the request body as it arrives; everything else gets it read up front.
+        body = None
+        if not ((b"content-length" in headers or b"transfer-encoding" in headers) and self.streams_body(path)):
+            recv_start = time.perf_counter()
+            body = await self._read_body(receive)
+            timings["recv"] = (time.perf_counter() - recv_start) * 1000
+
+        profile = start_profile() if profile_requested(scope, headers) else None
+        if profile is not None:
+            send = tag_response(send, scope["log"]["id"])
+        sampled = sampler.begin()
+        try:
+            status_code = await self._dispatch(scope, body, receive, send, path, timings, request_start)
+        finally:
+            if profile is not None:
+                stop_profile(profile)
+            stacks = sampler.end(sampled, (time.perf_counter() - request_start) * 1000)
+        if profile is not None:
+            scope["log"]["profile"] = await asyncio.to_thread(write_profile, profile, scope["log"]["id"])
+        elif stacks is not None:
+            scope["log"]["profile"] = await asyncio.to_thread(write_stacks, stacks, scope["log"]["id"])
+        self._finish(scope, status_code, request_start, timings)
+
+    def _finish(self, scope: Scope, status_code: int, request_start: float, timings: dict):
+        # Prerendering (export, thumbnails) runs in-process through the app; it is not traffic, so it stays out of the access log and metrics.
+        if scope.get("prerender"):
+            finalize_log(scope["log"], status_code, request_start, timings, write=False)
+            return
+        finalize_log(scope["log"], status_code, request_start, timings)
+        metrics.observe(scope["log"].get("route"), status_code, timings)
+
+    def _resolve_path(self, subdomain: str, path: str) -> str:
+        if subdomain in ["", "www"]:
+            return path
+        key = (subdomain, path)
+        if (resolved := dispatch_cache.get(key)) is not None:
+            return resolved
+
+        original_path = path if path.strip() else "/"
+        candidates = [f"/{'/'.join(subdomain.split('.')[::-1])}{original_path}", path]
+
+        resolved = path
+        for candidate in candidates:
+            if self.route_exists(candidate):
+                resolved = candidate
+                break
+            if candidate != "/" and candidate.endswith("/") and self.route_exists(candidate.rstrip("/")):
+                resolved = candidate.rstrip("/")
+                break
+        dispatch_cache.set(key, resolved, size=len(subdomain) + len(path) + len(resolved))
+        return resolved
 
-    async def _get_response(self, scope: Scope, receive: Receive, path: str, timings: dict, key: str) -> Response:
+    async def _dispatch(self, scope: Scope, body: bytes | None, receive: Receive, send: Send, path: str, timings: dict, request_start: float) -> int:
         new_scope = dict(scope, path=path)
 
+        mode = None
         status_code = 200
-        resp_headers = []
+        start_message: Message = {}
         body_parts = []
 
-        async def capture_send(message):
-            nonlocal status_code, resp_headers
+        delivered = False
+        async def replay_receive():
+            nonlocal delivered
+            if not delivered and body is not None:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def dispatch_send(message: Message):
+            nonlocal mode, status_code, start_message
             if message["type"] == "http.response.start":
                 status_code = message["status"]
-                resp_headers = message.get("headers", [])
-            elif message["type"] == "http.response.body":
-                body_parts.append(message.get("body", b""))
-
-        body = await self._read_body(receive)
-        async def cached_receive():
-            return {"type": "http.request", "body": body, "more_body": False}
+                start_message = message
+                headers = MutableHeaders(scope=message)
+                compressible = self._compressible(headers, status_code, int(headers.get("content-length", 0)))
+                # Whether this client gets it compressed or not, the representation depends on Accept-Encoding.
+                if compressible and "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+                if minify_kind(headers.get("content-type", "")) or (headers.get("content-type", "").startswith("text/html") and "etag" not in headers and not new_scope.get("spliced")):
+                    mode = "buffer"
+                elif compressible and int(headers["content-length"]) <= Compression.max_buffer and new_scope.get("method") == "GET" and negotiate(Headers(scope=new_scope).get("accept-encoding", "")):
+                    mode = "buffer"
+                elif self._not_modified(new_scope, headers, status_code):
+                    mode = "discard"
+                    status_code = message["status"] = 304
+                    del headers["content-length"]
+                    del headers["content-type"]
+                    timings["app"] = (time.perf_counter() - app_start) * 1000
+                    self._apply_headers(headers, timings, {}, request_start)
+                    await send(message)
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+                else:
+                    mode = "stream"
+                    timings["app"] = (time.perf_counter() - app_start) * 1000
+                    self._apply_headers(headers, timings, {}, request_start)
+                    await send(message)
+            elif mode == "buffer":
+                if message["type"] == "http.response.body":
+                    body_parts.append(message.get("body", b""))
+                elif message["type"] == "http.response.pathsend":
+                    body_parts.append(Path(message["path"]).read_bytes())
+            elif mode == "stream":
+                await send(message)
 
         app_start = time.perf_counter()
-        await self.app(new_scope, cached_receive, capture_send)
-        timings[key] = timings.get(key, 0.0) + (time.perf_counter() - app_start) * 1000
-
-        response = Response(
-            content=b"".join(body_parts),
-            status_code=status_code,
-        )
-        if response.status_code == 404 and path != "/" and path.endswith("/"):
-            return await self._get_response(scope, cached_receive, path.rstrip("/"), timings, key)
-        for k, v in resp_headers:
-            response.headers.raw.append((k, v))
-        return response
+        await self.app(new_scope, replay_receive, dispatch_send)
+        if mode == "buffer":
+            timings["app"] = (time.perf_counter() - app_start) * 1000
+            response = Response(content=b"".join(body_parts), status_code=status_code)
+            for k, v in start_message.get("headers", []):
+                response.headers.raw.append((k, v))
+            await self._send(response, new_scope, replay_receive, send, timings, request_start)
+        return status_code
+
+    def _compressible(self, headers: MutableHeaders, status_code: int, size: int) -> bool:
+        return status_code == 200 and "content-encoding" not in headers and is_compressible(headers.get("content-type", "")) and size >= Compression.min_size
+
+    def _not_modified(self, scope: Scope, headers: MutableHeaders, status_code: int) -> bool:
+        if status_code != 200 or scope.get("method", "GET") not in ["GET", "HEAD"]:
+            return False
+        if "etag" not in headers and "last-modified" not in headers:
+            return False
+        last_modified = None
+        if "last-modified" in headers:
+            try:
+                last_modified = parsedate_to_datetime(headers["last-modified"]).timestamp()
+            except (TypeError, ValueError):
+                pass
+        return is_not_modified(Headers(scope=scope), headers.get("etag"), last_modified)
 
     async def _read_body(self, receive: Receive) -> bytes:
         body = b""
@@ -110,63 +257,74 @@ class Middleware:
                 break
         return body
 
-    async def _send(self, response: Response, scope, receive, send, timings: dict, request_start: float):
-        content_type = response.headers.get("content-type", "")
+    def _apply_headers(self, headers: MutableHeaders, timings: dict, timing_descriptions: dict, request_start: float):
+        content_type = headers.get("content-type", "")
 
-        response.headers["Server"] = f"nercone.dev ({VERSION[:7]})"
-        response.headers["Onion-Location"] = f"http://{Hostnames.onion}/"
-        response.headers["Link"] = "<https://nercone.dev/sitemap.xml>; rel=\"sitemap\", <https://nercone.dev/robots.txt>; rel=\"robots\""
+        headers["Server"] = f"nercone.dev ({VERSION[:7]})"
+        headers["Onion-Location"] = f"http://{Hostnames.onion}/"
+        headers["Link"] = "<https://nercone.dev/sitemap.xml>; rel=\"sitemap\", <https://nercone.dev/robots.txt>; rel=\"robots\""
 
-        if "access-control-allow-origin" not in response.headers:
-            response.headers["Access-Control-Allow-Origin"] = "*"
-            response.headers["Access-Control-Allow-Methods"] = "*"
-            response.headers["Access-Control-Allow-Headers"] = "*"
+        if "access-control-allow-origin" not in headers:
+            headers["Access-Control-Allow-Origin"] = "*"
+            headers["Access-Control-Allow-Methods"] = "*"
+            headers["Access-Control-Allow-Headers"] = "*"
 
-        if "referrer-policy" not in response.headers:
-            response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        if "referrer-policy" not in headers:
+            headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
 
-        if "content-security-policy" not in response.headers:
-            response.headers["Content-Security-Policy"] = "default-src 'self' assets.nercone.dev; script-src 'self' assets.nercone.dev 'unsafe-inline'; style-src 'self' assets.nercone.dev fonts.googleapis.com 'unsafe-inline'; font-src 'self' assets.nercone.dev fonts.gstatic.com; img-src 'self' assets.nercone.dev t3tra.dev drsb.f5.si data:; connect-src 'self'; frame-ancestors 'self'; base-uri 'self'; form-action 'self'; upgrade-insecure-requests;"
+        if "content-security-policy" not in headers:
+            headers["Content-Security-Policy"] = "default-src 'self' assets.nercone.dev; script-src 'self' assets.nercone.dev 'unsafe-inline'; style-src 'self' assets.nercone.dev fonts.googleapis.com 'unsafe-inline'; font-src 'self' assets.nercone.dev fonts.gstatic.com; img-src 'self' assets.nercone.dev t3tra.dev drsb.f5.si data:; connect-src 'self'; frame-ancestors 'self'; base-uri 'self'; form-action 'self'; upgrade-insecure-requests;"
 
-        if "permissions-policy" not in response.headers:
-            response.headers["Permissions-Policy"] = "camera=(), microphone=(), geolocation=(), payment=(), usb=(), accelerometer=(), gyroscope=(), magnetometer=(), display-capture=()"
+        if "permissions-policy" not in headers:
+            headers["Permissions-Policy"] = "camera=(), microphone=(), geolocation=(), payment=(), usb=(), accelerometer=(), gyroscope=(), magnetometer=(), display-capture=()"
 
         if any(content_type.startswith(t) for t in ["text/html", "text/css", "text/javascript", "application/javascript"]):
-            response.headers["Cache-Control"] = "no-cache"
+            headers["Cache-Control"] = "no-cache"
         else:
-            response.headers["Cache-Control"] = "public, max-age=3600"
+            headers["Cache-Control"] = "public, max-age=3600"
 
-        if "text/css" in content_type:
-            minify_start = time.perf_counter()
-            try:
-                response.body = rcssmin.cssmin(response.body.decode("utf-8", errors="replace")).encode("utf-8")
-            except Exception:
-                pass
-            timings["minify"] = timings.get("minify", 0.0) + (time.perf_counter() - minify_start) * 1000
-        elif any(content_type.startswith(t) for t in ["text/javascript", "application/javascript"]):
-            minify_start = time.perf_counter()
-            try:
-                response.body = rjsmin.jsmin(response.body.decode("utf-8", errors="replace")).encode("utf-8")
-            except Exception:
-                pass
-            timings["minify"] = timings.get("minify", 0.0) + (time.perf_counter() - minify_start) * 1000
-        elif "image/svg+xml" in content_type:
+        timings["total"] = (time.perf_counter() - request_start) * 1000
+        timings_header = ", ".join([f"{name};dur={round(value, 3)}" + (f";desc=\"{timing_descriptions[name]}\"" if name in timing_descriptions else "") for name, value in timings.items()])
+        if "Server-Timing" in headers:
+            timings_header = headers.get("Server-Timing", "").strip() + ", " + timings_header
+        headers["Server-Timing"] = timings_header
+
+    async def _send(self, response: Response, scope, receive, send, timings: dict, request_start: float):
+        timing_descriptions = {}
+        # Minified assets and responses with the app's own validator repeat byte for byte; anything else (pages with the
+        # access count, /status) differs every time, so its compressed form would only push reusable entries out of the cache.
+        repeats = "etag" in response.headers
+        if kind := minify_kind(response.headers.get("content-type", "")):
+            repeats = True
             minify_start = time.perf_counter()
-            try:
-                options = scour.generateDefaultOptions()
-                options.newlines = False
-                options.shorten_ids = True
-                options.strip_comments = True
-                response.body = scour.scourString(response.body.decode("utf-8", errors="replace"), options).encode("utf-8")
-            except Exception:
-                pass
+            response.body, timing_descriptions["minify"] = await minify_async(kind, response.body)
+            if timing_descriptions["minify"] == "skipped" and "etag" in response.headers:
+                # The app's strong ETag names the minified bytes, which this response does not carry.
+                del response.headers["etag"]
             timings["minify"] = timings.get("minify", 0.0) + (time.perf_counter() - minify_start) * 1000
-        response.headers["Content-Length"] = str(len(response.body))
-
-        timings["total"] = (time.perf_counter() - request_start) * 1000
-        timings_header = ", ".join([f"{name};dur={round(value, 3)}" for name, value in timings.items()])
-        if "Server-Timing" in response.headers:
-            timings_header = response.headers.get("Server-Timing", "").strip() + ", " + timings_header
-        response.headers["Server-Timing"] = timings_header
+        compressible = self._compressible(response.headers, response.status_code, len(response.body))
+        if compressible and "accept-encoding" not in response.headers.get("vary", "").lower():
+            response.headers.add_vary_header("Accept-Encoding")
+        if response.status_code == 200 and scope.get("method", "GET") in ["GET", "HEAD"] and "etag" not in response.headers and not scope.get("spliced") and timing_descriptions.get("minify") != "skipped":
+            response.headers["ETag"] = make_etag(response.body)
+        if self._not_modified(scope, response.headers, response.status_code):
+            response.status_code = 304
+            response.body = b""
+            del response.headers["content-length"]
+            del response.headers["content-type"]
+        else:
+            if compressible and (encoding := negotiate(Headers(scope=scope).get("accept-encoding", ""))):
+                compress_start = time.perf_counter()
+                if repeats:
+                    response.body, hit = compress_cached(encoding, response.body)
+                    timing_descriptions["compress"] = "hit" if hit else "miss"
+                else:
+                    response.body = compress(encoding, response.body)
+                timings["compress"] = timings.get("compress", 0.0) + (time.perf_counter() - compress_start) * 1000
+                response.headers["Content-Encoding"] = encoding
+                if "etag" in response.headers:
+                    response.headers["ETag"] = encoded_etag(response.headers["etag"], encoding)
+            response.headers["Content-Length"] = str(len(response.body))
 
+        self._apply_headers(response.headers, timings, timing_descriptions, request_start)
         await response(scope, receive, send)
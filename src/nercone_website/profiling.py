@@ -0,0 +1,155 @@
+import sys
+import hmac
+import time
+import asyncio
+import cProfile
+import threading
+import ipaddress
+from pathlib import Path
+from starlette.datastructures import MutableHeaders
+from starlette.types import Scope, Send, Message
+from .config import Directories, Profiling
+
+profile_lock = threading.Lock()
+profiling = False
+waiting = "(waiting)"
+
+def requested(scope: Scope, headers: dict[bytes, bytes]) -> bool:
+    if not Profiling.secret or (value := headers.get(Profiling.header)) is None:
+        return False
+    try:
+        address = ipaddress.ip_address((scope.get("client") or ("", 0))[0])
+    except ValueError:
+        return False
+    return (address.is_private or address.is_loopback) and hmac.compare_digest(value, Profiling.secret.encode())
+
+def start_profile() -> cProfile.Profile | None:
+    # Only one profiler can be active per interpreter, and it sees every task on the loop while enabled.
+    global profiling
+    with profile_lock:
+        if profiling:
+            return None
+        profiling = True
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        stop_profile(None)
+        return None
+    return profile
+
+def stop_profile(profile: cProfile.Profile | None):
+    global profiling
+    if profile is not None:
+        profile.disable()
+    with profile_lock:
+        profiling = False
+
+def tag_response(send: Send, log_id: str) -> Send:
+    async def tagged_send(message: Message):
+        if message["type"] == "http.response.start":
+            MutableHeaders(scope=message).append("X-Profile-Id", log_id)
+        await send(message)
+    return tagged_send
+
+def prune():
+    try:
+        files = sorted(Directories.profiles.iterdir(), key=lambda path: path.stat().st_mtime)
+    except OSError:
+        return
+    for path in files[:max(len(files) - Profiling.max_files, 0)]:
+        path.unlink(missing_ok=True)
+
+def write_profile(profile: cProfile.Profile, log_id: str) -> str:
+    Directories.profiles.mkdir(parents=True, exist_ok=True)
+    path = Directories.profiles.joinpath(f"{log_id}.pstats")
+    profile.dump_stats(path)
+    prune()
+    return str(path.relative_to(Directories.logs))
+
+def write_stacks(stacks: dict[str, int], log_id: str) -> str:
+    Directories.profiles.mkdir(parents=True, exist_ok=True)
+    path = Directories.profiles.joinpath(f"{log_id}.folded")
+    path.write_text("".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items())), encoding="utf-8")
+    prune()
+    return str(path.relative_to(Directories.logs))
+
+class SampledRequest:
+    __slots__ = ("task", "loop", "thread", "start", "stacks")
+
+    def __init__(self):
+        self.task = asyncio.current_task()
+        self.loop = asyncio.get_running_loop()
+        self.thread = threading.get_ident()
+        self.start = time.perf_counter()
+        self.stacks: dict[str, int] = {}
+
+class SlowRequestSampler:
+    def __init__(self, threshold: float = Profiling.slow_threshold, interval: float = Profiling.sample_interval):
+        # Sampling starts at half the threshold so requests that only just cross it still get a useful number of samples.
+        self.threshold = threshold
+        self.after = threshold / 2000
+        self.interval = interval / 1000
+        self.condition = threading.Condition()
+        self.requests: set[SampledRequest] = set()
+        self.labels: dict = {}
+        self.thread: threading.Thread | None = None
+
+    def begin(self) -> SampledRequest | None:
+        if self.threshold <= 0:
+            return None
+        request = SampledRequest()
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="slow-request-sampler", daemon=True)
+                self.thread.start()
+            self.requests.add(request)
+            if len(self.requests) == 1:
+                self.condition.notify()
+        return request
+
+    def end(self, request: SampledRequest | None, duration: float) -> dict[str, int] | None:
+        if request is None:
+            return None
+        with self.condition:
+            self.requests.discard(request)
+        # Slow clients keep a streaming response open without using the CPU; a profile of only (waiting) samples says nothing.
+        if duration >= self.threshold and any(stack != waiting for stack in request.stacks):
+            return request.stacks
+        return None
+
+    def _label(self, code) -> str:
+        if (label := self.labels.get(code)) is None:
+            label = self.labels[code] = f"{code.co_name} ({'/'.join(Path(code.co_filename).parts[-2:])}:{code.co_firstlineno})"
+        return label
+
+    def _stack(self, frame) -> str:
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def _run(self):
+        with self.condition:
+            while True:
+                while not self.requests:
+                    self.condition.wait()
+                now = time.perf_counter()
+                due = [request for request in self.requests if now - request.start >= self.after]
+                if not due:
+                    self.condition.wait(max(min(request.start for request in self.requests) + self.after - now, self.interval))
+                    continue
+
+                frames = sys._current_frames()
+                for request in due:
+                    # A sample only counts against the request whose task is running; otherwise it is waiting on I/O, a thread or other tasks.
+                    if asyncio.current_task(request.loop) is request.task and (frame := frames.get(request.thread)) is not None:
+                        stack = self._stack(frame)
+                    else:
+                        stack = waiting
+                    request.stacks[stack] = request.stacks.get(stack, 0) + 1
+                del frames
+                self.condition.wait(self.interval)
+
+sampler = SlowRequestSampler()
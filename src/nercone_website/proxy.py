@@ -1,10 +1,74 @@
 import time
-import httpx
 import asyncio
-from websockets.client import connect
+from typing import TYPE_CHECKING
 from fastapi import Request, Response, WebSocket
+from starlette.websockets import WebSocketState
+from fastapi.responses import StreamingResponse
+from .config import Proxy, WebSockets
 
-hop_by_hop_headers = ["transfer-encoding", "connection", "keep-alive", "upgrade", "proxy-authenticate", "proxy-authorization", "te", "trailers", "content-encoding", "content-length"]
+# httpx and websockets are only imported once a proxy is actually used.
+if TYPE_CHECKING:
+    import httpx
+
+hop_by_hop_headers = ["transfer-encoding", "connection", "keep-alive", "upgrade", "proxy-authenticate", "proxy-authorization", "te", "trailers"]
+
+directions = ["upstream", "downstream"]
+
+clients: dict[str, "httpx.AsyncClient"] = {}
+
+class RelayStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.messages = dict.fromkeys(directions, 0)
+        self.bytes = dict.fromkeys(directions, 0)
+        self.relay_ms = dict.fromkeys(directions, 0.0)
+
+    def add(self, direction: str, size: int, relay_ms: float):
+        self.messages[direction] += 1
+        self.bytes[direction] += size
+        self.relay_ms[direction] += relay_ms
+
+    def as_dict(self) -> dict:
+        return {
+            "lifetime": time.monotonic() - self.started,
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "relay_ms": {direction: round(self.relay_ms[direction], 3) for direction in directions}
+        }
+
+active_relays: set[RelayStats] = set()
+closed_relays = {"connections": 0, "lifetime": 0.0, "messages": dict.fromkeys(directions, 0), "bytes": dict.fromkeys(directions, 0), "relay_ms": dict.fromkeys(directions, 0.0)}
+
+def websocket_stats() -> dict:
+    totals = {key: dict(closed_relays[key]) for key in ["messages", "bytes", "relay_ms"]}
+    for relay in active_relays:
+        for key in totals:
+            for direction in directions:
+                totals[key][direction] += getattr(relay, key)[direction]
+    totals["relay_ms"] = {direction: round(value, 3) for direction, value in totals["relay_ms"].items()}
+    return {"active": len(active_relays), "closed": closed_relays["connections"], "closed_lifetime": round(closed_relays["lifetime"], 3)} | totals
+
+def _close_code(code: int | None) -> int:
+    if code is None or code == 1005:
+        return 1000
+    if code in [1004, 1006, 1015] or not (1000 <= code <= 1014 or 3000 <= code <= 4999):
+        return 1011
+    return code
+
+def get_client(base_url: str) -> "httpx.AsyncClient":
+    import httpx
+    if (client := clients.get(base_url)) is None or client.is_closed:
+        client = clients[base_url] = httpx.AsyncClient(
+            http2=Proxy.http2,
+            limits=httpx.Limits(max_connections=Proxy.max_connections, max_keepalive_connections=Proxy.max_keepalive_connections, keepalive_expiry=Proxy.keepalive_expiry),
+            timeout=httpx.Timeout(Proxy.timeout, connect=Proxy.connect_timeout)
+        )
+    return client
+
+async def close_clients():
+    while clients:
+        _, client = clients.popitem()
+        await client.aclose()
 
 def _prefix_server_timing(value: str, prefix: str) -> str:
     parts = []
@@ -23,29 +87,51 @@ def _prefix_server_timing(value: str, prefix: str) -> str:
 def make_http_proxy(base_url_http: str, headers: dict = {}, remove_prefix_path: bool = False):
     async def http_proxy(request: Request, path: str = "") -> Response:
         url = f"{base_url_http}/{path}" if remove_prefix_path else f"{base_url_http}{request.url.path}"
-        merged_headers = dict(request.headers)
+        merged_headers = {k: v for k, v in request.headers.items() if k not in hop_by_hop_headers}
         merged_headers.pop("accept-encoding", None)
         merged_headers |= {k.lower(): v for k, v in headers.items()}
         raw_headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in merged_headers.items()]
-        async with httpx.AsyncClient() as client:
-            upstream_start = time.perf_counter()
-            resp = await client.request(
-                method=request.method,
-                url=url,
-                headers=raw_headers,
-                content=await request.body(),
-                params=request.query_params
-            )
-            upstream_dur_ms = (time.perf_counter() - upstream_start) * 1000
-        response = Response(content=resp.content, status_code=resp.status_code)
+        has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+
+        connection = {"reused": True, "connect": 0.0}
+        async def trace(event_name: str, info: dict):
+            if event_name == "connection.connect_tcp.started":
+                connection["reused"] = False
+                connection["connect_start"] = time.perf_counter()
+            elif event_name == "connection.start_tls.complete" or (event_name == "connection.connect_tcp.complete" and not url.startswith("https://")):
+                connection["connect"] = (time.perf_counter() - connection["connect_start"]) * 1000
+
+        client = get_client(base_url_http)
+        upstream_request = client.build_request(
+            method=request.method,
+            url=url,
+            headers=raw_headers,
+            content=request.stream() if has_body else None,
+            params=request.query_params,
+            extensions={"trace": trace}
+        )
+        upstream_start = time.perf_counter()
+        resp = await client.send(upstream_request, stream=True)
+        upstream_dur_ms = (time.perf_counter() - upstream_start) * 1000
+
+        async def body():
+            try:
+                async for chunk in resp.aiter_bytes():
+                    yield chunk
+            finally:
+                await resp.aclose()
+
+        # aiter_bytes() decodes any content-encoding, so the upstream length only holds for identity bodies.
+        excluded_headers = hop_by_hop_headers + ["server-timing"] + (["content-encoding", "content-length"] if "content-encoding" in resp.headers else [])
+        response = StreamingResponse(body(), status_code=resp.status_code)
         for k, v in resp.headers.multi_items():
-            if k.lower() in hop_by_hop_headers:
-                continue
-            if k.lower() == "server-timing":
+            if k.lower() in excluded_headers:
                 continue
             response.headers.append(k, v)
 
-        timing_parts = [f"upstream;dur={round(upstream_dur_ms, 3)}"]
+        timing_parts = [f"upstream;dur={round(upstream_dur_ms, 3)};desc=\"{'reused' if connection['reused'] else 'new'} {resp.http_version}\""]
+        if not connection["reused"]:
+            timing_parts.append(f"upstream-connect;dur={round(connection['connect'], 3)}")
         for k, v in resp.headers.multi_items():
             if k.lower() == "server-timing" and v.strip():
                 prefixed = _prefix_server_timing(v, "upstream")
@@ -53,21 +139,86 @@ def make_http_proxy(base_url_http: str, headers: dict = {}, remove_prefix_path:
                     timing_parts.append(prefixed)
         response.headers["Server-Timing"] = ", ".join(timing_parts)
         return response
+    # The middleware leaves the request body unread for this endpoint, so request.stream() relays it as it arrives.
+    http_proxy.streams_body = True
     return http_proxy
 
 def make_websocket_proxy(base_url_websocket: str, remove_prefix_path: bool = False):
+    from websockets.asyncio.client import connect
+    from websockets.exceptions import ConnectionClosed
+
     async def websocket_proxy(client_ws: WebSocket, path: str = ""):
         url = f"{base_url_websocket}/{path}" if remove_prefix_path else f"{base_url_websocket}{client_ws.url.path}"
-        await client_ws.accept()
-        async with connect(url) as server_ws:
-            async def client_to_server():
-                async for message in client_ws.iter_bytes():
-                    await server_ws.send(message)
-            async def server_to_client():
-                async for message in server_ws:
-                    await client_ws.send_bytes(message)
-            await asyncio.gather(
-                asyncio.create_task(client_to_server()),
-                asyncio.create_task(server_to_client())
+        try:
+            server_ws = await connect(
+                url,
+                subprotocols=client_ws.scope.get("subprotocols") or None,
+                compression="deflate" if WebSockets.compression else None,
+                open_timeout=WebSockets.open_timeout,
+                ping_interval=WebSockets.ping_interval,
+                max_size=WebSockets.max_size,
+                max_queue=WebSockets.max_queue,
+                write_limit=WebSockets.write_limit
             )
+        except (OSError, asyncio.TimeoutError, ConnectionClosed):
+            await client_ws.close(code=1011)
+            return
+        await client_ws.accept(subprotocol=server_ws.subprotocol)
+
+        stats = RelayStats()
+        active_relays.add(stats)
+
+        async def client_to_server() -> tuple[str, int | None, str]:
+            while True:
+                message = await client_ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    return "client", message.get("code"), message.get("reason") or ""
+                relay_start = time.perf_counter()
+                data = message["text"] if message.get("text") is not None else message.get("bytes", b"")
+                try:
+                    await server_ws.send(data)
+                except ConnectionClosed:
+                    return "server", server_ws.close_code, server_ws.close_reason or ""
+                stats.add("upstream", len(data), (time.perf_counter() - relay_start) * 1000)
+
+        async def server_to_client() -> tuple[str, int | None, str]:
+            try:
+                async for data in server_ws:
+                    relay_start = time.perf_counter()
+                    if isinstance(data, str):
+                        await client_ws.send_text(data)
+                    else:
+                        await client_ws.send_bytes(data)
+                    stats.add("downstream", len(data), (time.perf_counter() - relay_start) * 1000)
+            except ConnectionClosed:
+                pass
+            return "server", server_ws.close_code, server_ws.close_reason or ""
+
+        upstream = asyncio.create_task(client_to_server())
+        downstream = asyncio.create_task(server_to_client())
+        try:
+            done, pending = await asyncio.wait([upstream, downstream], return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+            try:
+                closed_by, code, reason = done.pop().result()
+            except Exception:
+                closed_by, code, reason = None, 1011, ""
+
+            if closed_by != "server":
+                await server_ws.close(_close_code(code), reason)
+            if closed_by != "client" and client_ws.client_state == WebSocketState.CONNECTED and client_ws.application_state == WebSocketState.CONNECTED:
+                await client_ws.close(code=_close_code(code), reason=reason)
+        finally:
+            for task in [upstream, downstream]:
+                task.cancel()
+            await server_ws.close()
+            active_relays.discard(stats)
+            closed_relays["connections"] += 1
+            closed_relays["lifetime"] += time.monotonic() - stats.started
+            for key in ["messages", "bytes", "relay_ms"]:
+                for direction in directions:
+                    closed_relays[key][direction] += getattr(stats, key)[direction]
     return websocket_proxy
@@ -0,0 +1,125 @@
+import posixpath
+from pathlib import Path
+from typing import NamedTuple
+from .config import Directories
+
+class Route(NamedTuple):
+    static: str | None
+    template: str | None
+    markdown: str | None
+
+class FileInfo(NamedTuple):
+    mtime_ns: int
+    size: int
+
+# Raster images that may have a smaller WebP sibling next to them.
+variant_sources = (".png", ".jpg", ".jpeg")
+
+def accepts(accept: str, media_type: str) -> bool:
+    # Only an explicit media type counts; */* and image/* are sent by clients that did not ask for anything in particular.
+    for part in accept.lower().split(","):
+        value, _, params = part.partition(";")
+        if value.strip() == media_type:
+            params = params.strip()
+            try:
+                return not params.startswith("q=") or float(params[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+class RouteIndex:
+    def __init__(self, directory: Path = Directories.public):
+        self.directory = directory
+        self.files: dict[str, FileInfo] = {}
+        self.routes: dict[str, Route] = {}
+        self.variants: dict[str, str] = {}
+        self.built = False
+
+    def build(self):
+        root = self.directory.resolve()
+        files = {}
+        for path in sorted(self.directory.rglob("*")):
+            try:
+                if not path.is_file() or not path.resolve().is_relative_to(root):
+                    continue
+                stat = path.stat()
+            except OSError:
+                continue
+            files[path.relative_to(self.directory).as_posix()] = FileInfo(stat.st_mtime_ns, stat.st_size)
+
+        routes = {}
+        for name in files:
+            for request_path in self._request_paths(name):
+                if request_path not in routes and any(route := self._resolve(request_path, files)):
+                    routes[request_path] = route
+        variants = {}
+        for name, info in files.items():
+            if name.endswith(variant_sources):
+                webp = f"{posixpath.splitext(name)[0]}.webp"
+                if webp in files and files[webp].size < info.size:
+                    variants[name] = webp
+        self.files, self.routes, self.variants, self.built = files, routes, variants, True
+
+    def _request_paths(self, name: str) -> list[str]:
+        request_paths = [name, f"{name}/"]
+        for extension in [".html", ".md"]:
+            if name.endswith(extension):
+                stem = name[:-len(extension)]
+                request_paths += [stem, f"{stem}/", f"{stem}.html", f"{stem}.md"]
+                if posixpath.basename(stem) in ["index", "README"]:
+                    directory = posixpath.dirname(stem)
+                    request_paths += [directory, f"{directory}/"] if directory else ["", "/"]
+        return request_paths
+
+    def _resolve(self, full_path: str, files: dict[str, FileInfo]) -> Route:
+        static = None
+        if not full_path.endswith(".html") and not full_path.endswith(".md"):
+            static = full_path.rstrip("/") if full_path.rstrip("/") in files else None
+
+        if full_path in ["", "/"]:
+            template_candidates = ["index.html", "README.html"]
+            markdown_candidates = ["index.md",   "README.md"]
+        elif full_path.endswith(".html"):
+            template_candidates = [f"{full_path[:-5].strip('/')}.html"]
+            markdown_candidates = [f"{full_path[:-5].strip('/')}.md"]
+        elif full_path.endswith(".md"):
+            template_candidates = [f"{full_path[:-3].strip('/')}.html"]
+            markdown_candidates = [f"{full_path[:-3].strip('/')}.md"]
+        else:
+            template_candidates = [f"{full_path.strip('/')}.html", f"{full_path.strip('/')}/index.html", f"{full_path.strip('/')}/README.html"]
+            markdown_candidates = [f"{full_path.strip('/')}.md",   f"{full_path.strip('/')}/index.md",   f"{full_path.strip('/')}/README.md"]
+
+        template = next((name for name in template_candidates if name in files), None)
+        markdown = next((name for name in markdown_candidates if name in files), None)
+        return Route(static, template, markdown)
+
+    def lookup(self, full_path: str) -> Route | None:
+        if not self.built:
+            self.build()
+        if (route := self.routes.get(full_path)) is not None:
+            return route
+
+        if full_path.startswith("/") and not full_path.endswith(".html") and not full_path.endswith(".md"):
+            raise PermissionError()
+        normalized = posixpath.normpath(full_path.lstrip("/")) if full_path.strip("/") else ""
+        if normalized == ".." or normalized.startswith("../"):
+            raise PermissionError()
+        if normalized == ".":
+            normalized = ""
+        if normalized and full_path.endswith("/"):
+            normalized += "/"
+        return self.routes.get(normalized) if normalized != full_path else None
+
+    def variant(self, name: str, accept: str) -> str | None:
+        if not self.built:
+            self.build()
+        if (webp := self.variants.get(name)) is not None and accepts(accept, "image/webp"):
+            return webp
+        return None
+
+    def info(self, name: str) -> FileInfo | None:
+        if not self.built:
+            self.build()
+        return self.files.get(name)
+
+route_index = RouteIndex()
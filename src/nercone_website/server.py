@@ -1,30 +1,115 @@
 import io
 import re
-import json
+import hmac
+import time
+import shutil
+import signal
 import yaml
-import random
+import asyncio
+import logging
+import ipaddress
 import mistune
-import resvg_py
-from html import escape
 from pathlib import Path
-from bs4 import BeautifulSoup
-from markitdown import MarkItDown
-from datetime import datetime, timezone
+from datetime import datetime
 from zoneinfo import ZoneInfo
+from contextlib import contextmanager, asynccontextmanager
 from fastapi import FastAPI, Request, Response
+from fastapi.routing import APIRoute
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import PlainTextResponse, JSONResponse, FileResponse, RedirectResponse
-from jinja2.exceptions import TemplateNotFound
+from markupsafe import escape
+from jinja2 import Template, Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
 from .error import error_page
-from .config import VERSION, Hostnames, Directories, Files
+from .config import VERSION, Hostnames, Directories, Files, Caches, Compression, Limits, Monitoring
+from .cache import LRUCache
 from .database import AccessCounter
-from .middleware import Middleware
+from .middleware import Middleware, minify_cache, dispatch_cache
+from .logger import writer as access_log_writer
+from .content import ShortURLs, Quotes
+from .watcher import watch, on_change, reload_all
+from .routes import route_index
+from .conditional import make_etag, is_not_modified, not_modified, validator_headers
+from .compression import compressed_cache, negotiate, is_compressible, is_precompressible, static_content_type, get_precompressed, encoded_etag
+from .metrics import set_route, collect as collect_metrics, publish as publish_metrics, write_snapshot as write_metrics_snapshot
+from .proxy import close_clients as close_proxy_clients, websocket_stats
+from .limits import limiters, Overloaded, stats as limits_stats
+from . import thumbnail as thumbnails
 
-app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
-app.add_middleware(Middleware)
-templates = Jinja2Templates(directory=Directories.public)
-markitdown = MarkItDown()
+startup_timings: dict[str, float] = {}
+
+@contextmanager
+def timed(name: str):
+    start = time.perf_counter()
+    yield
+    startup_timings[name] = round((time.perf_counter() - start) * 1000, 3)
+
+def prepare_bytecode_cache() -> Path:
+    # Bytecode is checked against the template source anyway; keying by VERSION lets old deploys be cleaned up.
+    # The newest other directory is kept, since the previous deploy may still be draining and writing to it.
+    directory = Directories.caches.joinpath("jinja", VERSION or "unversioned")
+    directory.mkdir(parents=True, exist_ok=True)
+    # Every worker runs this at import, so a directory listed here may already be gone by the time it is stat()ed.
+    def mtime(other: Path) -> float:
+        try:
+            return other.stat().st_mtime
+        except OSError:
+            return 0.0
+    others = sorted((other for other in directory.parent.iterdir() if other != directory), key=mtime, reverse=True)
+    for other in others[1:]:
+        shutil.rmtree(other, ignore_errors=True)
+    return directory
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with timed("access_counter"):
+        accesscounter.start()
+    with timed("access_log"):
+        access_log_writer.start()
+    with timed("shorturls"):
+        shorturls.load()
+    with timed("route_index"):
+        route_index.build()
+        dispatch_cache.clear()
+    with timed("warm_caches"):
+        await asyncio.to_thread(warm_caches)
+    stop_watching = asyncio.Event()
+    watcher = asyncio.create_task(watch(stop_watching))
+    metrics_publisher = asyncio.create_task(publish_metrics()) if Monitoring.directory else None
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_all)
+    yield
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+    stop_watching.set()
+    await watcher
+    if metrics_publisher is not None:
+        metrics_publisher.cancel()
+        try:
+            await metrics_publisher
+        except asyncio.CancelledError:
+            pass
+        await asyncio.to_thread(write_metrics_snapshot)
+    await accesscounter.stop()
+    access_log_writer.close()
+    await close_proxy_clients()
+    thumbnails.shutdown()
+
+logger = logging.getLogger(__name__)
+app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
+templates = Jinja2Templates(env=Environment(
+    loader=FileSystemLoader(Directories.public),
+    autoescape=select_autoescape(),
+    # Templates are dropped from the cache by reload_templates instead of being stat()ed on every get_template.
+    auto_reload=False,
+    bytecode_cache=FileSystemBytecodeCache(str(prepare_bytecode_cache()))
+))
+markitdown = None
 accesscounter = AccessCounter()
+shorturls = ShortURLs()
+quotes = Quotes()
+page_cache = LRUCache(Caches.pages)
+markdown_cache = LRUCache(Caches.markdowns)
+rendered_cache = LRUCache(Caches.rendered)
 templates.env.globals["get_access_count"] = accesscounter.get
 templates.env.globals["server_version"] = VERSION
 templates.env.globals["onion_site_url"] = f"http://{Hostnames.onion}/"
@@ -45,32 +130,185 @@ def this_year_in_heisei() -> int: # heysay is not ended.
     return datetime.now(ZoneInfo("Asia/Tokyo")).year - 1989
 templates.env.globals["this_year_in_heisei"] = this_year_in_heisei
 
-def get_daily_quote() -> str:
-    seed = str(datetime.now(timezone.utc).date())
-    with Files.quotes.open("r") as f:
-        quotes = f.read().strip().split("\n")
-    return random.Random(seed).choice(quotes)
+get_daily_quote = quotes.daily
 templates.env.globals["get_daily_quote"] = get_daily_quote
 
-def resolve_static_file(full_path: str) -> Path | None:
-    path = Directories.public.joinpath(full_path).resolve()
-    if not path.is_relative_to(Directories.public):
-        raise PermissionError()
-    return path if path.is_file() else None
-
-def resolve_shorturl(shorturls: dict, full_path: str) -> str | None:
-    current_id = full_path.strip().rstrip("/")
-    visited = set()
-    for _ in range(10):
-        if current_id in visited or current_id not in shorturls:
-            return None
-        visited.add(current_id)
-        entry = shorturls[current_id]
-        if entry["type"] in ["redirect", "alias"]:
-            if entry["type"] == "redirect":
-                return entry["content"]
-            current_id = entry["content"]
-    return None
+# Globals whose value changes between requests; rendered pages keep a placeholder for them and splice the value in per hit.
+dynamic_fragments = {
+    "get_access_count": lambda: str(accesscounter.get()),
+    "get_daily_quote": lambda: get_daily_quote()
+}
+# Only digits between the markers, so neither autoescape nor Markdown escaping touches them.
+placeholders = {name: f"\ue000{i}\ue000" for i, name in enumerate(dynamic_fragments)}
+placeholder_pattern = re.compile("\ue000([0-9]+)\ue000")
+
+def split_placeholders(text: str) -> list[str]:
+    parts = placeholder_pattern.split(text)
+    parts[1::2] = [list(dynamic_fragments)[int(index)] for index in parts[1::2]]
+    return parts
+
+@on_change
+def reload_content(paths: set[Path]):
+    route_index.build()
+    if Files.shorturls in paths:
+        shorturls.load()
+    if Files.quotes in paths:
+        quotes.load()
+    dispatch_cache.clear()
+
+@on_change
+def reload_templates(paths: set[Path]):
+    if any(path.suffix == ".html" for path in paths):
+        templates.env.cache.clear()
+        rendered_cache.clear()
+        # Markdown entries are validated against the page's own file only, not base.html or included partials.
+        markdown_cache.clear()
+
+def route_exists(path: str) -> bool:
+    if any(isinstance(route, APIRoute) and route.endpoint is not default_response and route.path_regex.match(path) for route in app.routes):
+        return True
+    try:
+        if (route := route_index.lookup(path[1:])) and any(route):
+            return True
+        return shorturls.resolve(path[1:]) is not None
+    except (PermissionError, FileNotFoundError, ValueError):
+        return False
+
+def streams_body(path: str) -> bool:
+    return any(isinstance(route, APIRoute) and getattr(route.endpoint, "streams_body", False) and route.path_regex.match(path) for route in app.routes)
+
+app.add_middleware(Middleware, route_exists=route_exists, streams_body=streams_body)
+
+def split_front_matter(markdown: str) -> tuple[dict, str]:
+    if not markdown.startswith("---"):
+        return {}, markdown
+    end = markdown.find("\n---", 3)
+    if end == -1:
+        return {}, markdown
+    return yaml.safe_load(markdown[3:end]) or {}, markdown[end+4:].lstrip("\n")
+
+def compile_markdown_page(name: str) -> Template:
+    validator = route_index.info(name)
+    if template := page_cache.get(name, validator=validator):
+        return template
+
+    with Directories.public.joinpath(name).open("r") as f:
+        markdown = f.read()
+    front, body = split_front_matter(markdown)
+
+    html = htmlitdown(body)
+    source = f"{{% extends \"/base.html\" %}}\n"
+    for block in front:
+        source += f"{{% block {block} %}}{front[block]}{{% endblock %}}\n"
+    source += f"{{% block content %}}\n{html}\n{{% endblock %}}\n"
+
+    template = templates.env.from_string(source)
+    page_cache.set(name, template, size=len(markdown) + len(source), validator=validator)
+    return template
+
+def render_with_placeholders(template: Template, request: Request) -> str | None:
+    calls = 0
+    def placeholder(name: str):
+        def call():
+            nonlocal calls
+            calls += 1
+            return placeholders[name]
+        return call
+    html = template.render(request=request, **{name: placeholder(name) for name in dynamic_fragments})
+    if len(placeholder_pattern.findall(html)) != calls:
+        # A placeholder went through a filter, so it cannot be spliced back in.
+        return None
+    return html
+
+def render_page(name: str, template: Template, request: Request) -> bytes:
+    # Templates only read request.url.path, so that and the host are the whole key.
+    if request.scope.get("prerender"):
+        return template.render(request=request).encode("utf-8")
+    key = (name, request.url.hostname, request.url.path)
+    validator = (VERSION, route_index.info(name))
+    if (parts := rendered_cache.get(key, validator=validator)) is None:
+        if (html := render_with_placeholders(template, request)) is None:
+            request.scope["spliced"] = True
+            return template.render(request=request).encode("utf-8")
+        parts = tuple(part.encode("utf-8") if i % 2 == 0 else part for i, part in enumerate(split_placeholders(html)))
+        rendered_cache.set(key, parts, size=sum(len(part) for part in parts), validator=validator)
+    # A body with a spliced value differs on every request, so the middleware does not give it a content ETag.
+    if len(parts) > 1:
+        request.scope["spliced"] = True
+    return b"".join(part if i % 2 == 0 else str(escape(dynamic_fragments[part]())).encode("utf-8") for i, part in enumerate(parts))
+
+def warm_caches():
+    for name in route_index.files:
+        try:
+            if name.endswith(".md"):
+                compile_markdown_page(name)
+            elif name.endswith(".html"):
+                templates.env.get_template(name)
+        except Exception:
+            logger.warning("failed to warm the cache for %s", name, exc_info=True)
+
+main_start_pattern = re.compile(r"<main[\s>]")
+
+def extract_main(html: str) -> str:
+    start = main_start_pattern.search(html)
+    end = html.rfind("</main>")
+    if start is None or end < start.start():
+        return html
+    return html[start.start():end + len("</main>")]
+
+def get_markitdown():
+    global markitdown
+    if markitdown is None:
+        from markitdown import MarkItDown
+        markitdown = MarkItDown()
+    return markitdown
+
+def html_to_markdown(html: str) -> str:
+    return get_markitdown().convert_stream(io.BytesIO(extract_main(html).encode("utf-8")), file_extension=".html").text_content
+
+def fill_markdown(parts: tuple[str, ...]) -> str:
+    return "".join(part if i % 2 == 0 else dynamic_fragments[part]() for i, part in enumerate(parts))
+
+def render_template_as_markdown(name: str, request: Request) -> tuple[str, ...] | None:
+    # Converted with placeholders so the access count and daily quote are filled in per request, like render_page.
+    template = templates.env.get_template(name)
+    if (html := render_with_placeholders(template, request)) is None:
+        return None
+    expected = len(placeholder_pattern.findall(extract_main(html)))
+    split = split_placeholders(html_to_markdown(html))
+    if len(split) // 2 != expected or any("\ue000" in part for part in split[::2]):
+        return None
+    return tuple(split)
+
+def render_template_as_markdown_uncached(name: str, request: Request) -> str:
+    return html_to_markdown(templates.env.get_template(name).render(request=request))
+
+async def convert_template_to_markdown(name: str, request: Request) -> str:
+    if request.scope.get("prerender"):
+        return await asyncio.to_thread(render_template_as_markdown_uncached, name, request)
+    validator = (VERSION, route_index.info(name))
+    stale = markdown_cache.peek(name)
+    if (parts := markdown_cache.get(name, validator=validator)) is not None:
+        return fill_markdown(parts)
+
+    try:
+        async with limiters["markdown-mode"].slot():
+            parts = await asyncio.to_thread(render_template_as_markdown, name, request)
+            if parts is None:
+                return await asyncio.to_thread(render_template_as_markdown_uncached, name, request)
+    except Overloaded:
+        if stale is None:
+            raise
+        limiters["markdown-mode"].stale += 1
+        return fill_markdown(stale)
+    markdown_cache.set(name, parts, size=sum(len(part) for part in parts), validator=validator)
+    return fill_markdown(parts)
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded) -> Response:
+    response = error_page(templates, request, 503, "現在アクセスが集中しているため処理できませんでした。しばらくしてから再度お試しください。", "ちょっと待って、今手が離せないの！")
+    response.headers["Retry-After"] = str(Limits.retry_after)
+    return response
 
 @app.api_route("/ping", methods=["GET"])
 async def ping(request: Request):
@@ -86,12 +324,37 @@ async def status(request: Request):
         {
             "status": "ok",
             "version": VERSION[:7],
+            "startup": startup_timings,
             "daily_quote": get_daily_quote(),
-            "access_count": accesscounter.get()
+            "access_count": accesscounter.get(),
+            "access_log": access_log_writer.stats(),
+            "websockets": websocket_stats(),
+            "limits": limits_stats(),
+            "caches": {
+                "pages": page_cache.stats(),
+                "markdowns": markdown_cache.stats(),
+                "rendered": rendered_cache.stats(),
+                "thumbnails": thumbnails.memory_cache.stats(),
+                "minified": minify_cache.stats(),
+                "compressed": compressed_cache.stats(),
+                "dispatch": dispatch_cache.stats()
+            }
         },
         status_code=200
     )
 
+@app.api_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request):
+    try:
+        address = ipaddress.ip_address(request.client.host if request.client else "")
+    except ValueError:
+        address = None
+    hostname = request.headers.get("host", "").split(":")[0].strip()
+    token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if address is None or not (address.is_private or address.is_loopback) or hostname not in Hostnames.local or (Monitoring.token and not hmac.compare_digest(token.encode(), Monitoring.token.encode())):
+        return error_page(templates, request, 404, "リクエストしたページは現在ご利用になれません。削除/移動されたか、URLが間違っている可能性があります。", "そんなページ知らないっ！")
+    return PlainTextResponse(await asyncio.to_thread(collect_metrics), status_code=200, media_type="text/plain; version=0.0.4")
+
 @app.api_route("/welcome", methods=["GET"])
 async def welcome(request: Request):
     return PlainTextResponse(
@@ -120,34 +383,44 @@ async def thumbnail(request: Request, path: str) -> Response:
     description = request.query_params.get("description", "No description.")
     template_type = request.query_params.get("template", "normal")
 
-    parts = [p for p in path.strip("/").split("/") if p]
-    path_display = "nercone.dev / " + " / ".join(parts) if parts else "nercone.dev"
-
-    svg_filename = "error.svg" if template_type == "error" else "normal.svg"
-    fonts_dir = Directories.public.joinpath("assets", "fonts")
+    set_route(request.scope, "thumbnail")
+    key = thumbnails.thumbnail_key(template_type, path, title, description)
+    format = thumbnails.negotiate_format(request.headers.get("accept", ""))
+    etag = f'"{key}"' if format == "png" else f'"{key}-{format}"'
+    headers = {"ETag": etag, "Vary": "Accept"} if len(thumbnails.formats) > 1 else {"ETag": etag}
+    if is_not_modified(request.headers, etag):
+        return Response(status_code=304, headers=headers)
 
-    svg_path = Directories.public.joinpath("assets", "images", "thumbnails", svg_filename)
-    svg = svg_path.read_text(encoding="utf-8")
-    svg = svg.replace("__PATH__", escape(path_display))
-    svg = svg.replace("__TITLE__", escape(title))
-    svg = svg.replace("__DESCRIPTION__", escape(description))
-
-    font_files = [
-        str(fonts_dir / "MesloBIZUD-Regular.ttf"),
-        str(fonts_dir / "InterBIZUD-Regular.ttf"),
-        str(fonts_dir / "InterBIZUD-Bold.ttf"),
-    ]
-    png = resvg_py.svg_to_bytes(svg, font_files=font_files, width=1200, height=630)
-    return Response(content=png, media_type="image/png")
+    image = await thumbnails.get_thumbnail(key, template_type, path, title, description, format)
+    return Response(content=image, media_type=f"image/{format}", headers=headers)
 
 @app.api_route("/{full_path:path}", methods=["GET", "POST", "HEAD"])
 async def default_response(request: Request, full_path: str) -> Response:
-    if not full_path.endswith(".html") and not full_path.endswith(".md"):
-        try:
-            if static := resolve_static_file(full_path):
-                return FileResponse(static)
-        except PermissionError:
-            return error_page(templates, request, 403, "何をしてるんです？脆弱性報告のためならいいのですが、データ盗んで悪用するためなら今すぐにやめてくださいね？", "ディレクトリトラバーサルね、知ってる。公開してないところ覗きたいの？えっt")
+    try:
+        route = route_index.lookup(full_path)
+    except PermissionError:
+        return error_page(templates, request, 403, "何をしてるんです？脆弱性報告のためならいいのですが、データ盗んで悪用するためなら今すぐにやめてくださいね？", "ディレクトリトラバーサルね、知ってる。公開してないところ覗きたいの？えっt")
+
+    if route and route.static:
+        set_route(request.scope, "static")
+        name = route.static
+        if variant := route_index.variant(name, request.headers.get("accept", "")):
+            name = variant
+        info = route_index.info(name)
+        etag = make_etag(name, info.mtime_ns, info.size, VERSION)
+        last_modified = info.mtime_ns / 1e9
+        headers = validator_headers(etag, last_modified)
+        if is_compressible(static_content_type(name) or "") and info.size >= Compression.min_size:
+            headers["Vary"] = "Accept-Encoding"
+        elif route.static in route_index.variants:
+            headers["Vary"] = "Accept"
+        if is_not_modified(request.headers, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        if is_precompressible(name, info) and (encoding := negotiate(request.headers.get("accept-encoding", ""))):
+            path = await get_precompressed(name, info, encoding)
+            headers |= {"ETag": encoded_etag(etag, encoding), "Content-Encoding": encoding}
+            return FileResponse(path, media_type=static_content_type(name), headers=headers)
+        return FileResponse(Directories.public.joinpath(name), headers=headers)
 
     markdown_mode = False
     markdown_ua = ["curl", "claude-user", "chatgpt-user", "google-extended", "perplexity-user"]
@@ -159,81 +432,54 @@ async def default_response(request: Request, full_path: str) -> Response:
     elif full_path.endswith(".md"):
         markdown_mode = True
 
-    if full_path in ["", "/"]:
-        template_candidates = ["index.html", "README.html"]
-        markdown_candidates = ["index.md",   "README.md"]
-    elif full_path.endswith(".html"):
-        template_candidates = [f"{full_path[:-5].strip('/')}.html"]
-        markdown_candidates = [f"{full_path[:-5].strip('/')}.md"]
-    elif full_path.endswith(".md"):
-        template_candidates = [f"{full_path[:-3].strip('/')}.html"]
-        markdown_candidates = [f"{full_path[:-3].strip('/')}.md"]
-    else:
-        template_candidates = [f"{full_path.strip('/')}.html", f"{full_path.strip('/')}/index.html", f"{full_path.strip('/')}/README.html"]
-        markdown_candidates = [f"{full_path.strip('/')}.md",   f"{full_path.strip('/')}/index.md",   f"{full_path.strip('/')}/README.md"]
-
-    def try_templates():
-        for name in template_candidates:
-            try:
-                if markdown_mode:
-                    content = templates.env.get_template(name).render(request=request)
-                    soup = BeautifulSoup(content, "html.parser")
-                    main = str(soup.find("main")) if soup.find("main") else content
-                    markdown = markitdown.convert_stream(io.BytesIO(main.encode("utf-8")), file_extension=".html")
-                    return PlainTextResponse(markdown.text_content, status_code=200, media_type="text/markdown")
-                else:
-                    return templates.TemplateResponse(status_code=200, request=request, name=name)
-            except TemplateNotFound:
-                continue
-        return None
+    async def try_templates():
+        if not route or not route.template:
+            return None
+        if markdown_mode:
+            set_route(request.scope, "markdown-mode")
+            # The body carries the current access count and quote, so the ETag has to come from the body itself.
+            markdown = await convert_template_to_markdown(route.template, request)
+            etag = make_etag(markdown)
+            if is_not_modified(request.headers, etag):
+                return not_modified(etag)
+            return PlainTextResponse(markdown, status_code=200, media_type="text/markdown", headers={"ETag": etag})
+        else:
+            set_route(request.scope, "template")
+            return Response(content=render_page(route.template, templates.env.get_template(route.template), request), status_code=200, media_type="text/html")
 
-    def try_markdowns():
-        for name in markdown_candidates:
-            try:
-                if not (markdown_path := resolve_static_file(name)):
-                    continue
-                with markdown_path.open("r") as f:
-                    markdown = f.read()
-                if markdown_mode:
-                    return PlainTextResponse(markdown, status_code=200, media_type="text/markdown")
-                else:
-                    if not markdown.startswith("---"):
-                        front = {}
-                        body = markdown
-                    else:
-                        end = markdown.find("\n---", 3)
-                        if end == -1:
-                            front = {}
-                            body = markdown
-                        else:
-                            front = yaml.safe_load(markdown[3:end]) or {}
-                            body = markdown[end+4:].lstrip("\n")
-
-                    html = htmlitdown(body)
-                    source = f"{{% extends \"/base.html\" %}}\n"
-                    for block in front:
-                        source += f"{{% block {block} %}}{front[block]}{{% endblock %}}\n"
-                    source += f"{{% block content %}}\n{html}\n{{% endblock %}}\n"
-
-                    content = templates.env.from_string(source).render(request=request)
-                    return Response(content=content, status_code=200, media_type="text/html")
-            except PermissionError:
-                return error_page(templates, request, 403, "何をしてるんです？脆弱性報告のためならいいのですが、データ盗んで悪用するためなら今すぐにやめてくださいね？", "ディレクトリトラバーサルね、知ってる。公開してないところ覗きたいの？えっt")
-        return None
+    async def try_markdowns():
+        if not route or not route.markdown:
+            return None
+        if markdown_mode:
+            set_route(request.scope, "markdown-mode")
+            info = route_index.info(route.markdown)
+            etag = make_etag("markdown", route.markdown, VERSION, *info)
+            last_modified = info.mtime_ns / 1e9
+            if is_not_modified(request.headers, etag, last_modified):
+                return not_modified(etag, last_modified)
+            with Directories.public.joinpath(route.markdown).open("r") as f:
+                markdown = f.read()
+            return PlainTextResponse(markdown, status_code=200, media_type="text/markdown", headers=validator_headers(etag, last_modified))
+        else:
+            set_route(request.scope, "markdown")
+            content = render_page(route.markdown, compile_markdown_page(route.markdown), request)
+            return Response(content=content, status_code=200, media_type="text/html")
 
     for try_fn in ([try_markdowns, try_templates] if markdown_mode else [try_templates, try_markdowns]):
-        if response := try_fn():
-            accesscounter.increase()
+        if response := await try_fn():
+            if not request.scope.get("prerender"):
+                accesscounter.increase()
             return response
 
     try:
-        if not Files.shorturls.is_file():
-            return error_page(templates, request, 500, "短縮URLの処理のためのJSONファイルがありません。", "設定ファイルぐらい用意しておけよ！")
-        shorturls = json.load(Files.shorturls.open("r", encoding="utf-8"))
-    except Exception:
+        result = shorturls.resolve(full_path)
+    except FileNotFoundError:
+        return error_page(templates, request, 500, "短縮URLの処理のためのJSONファイルがありません。", "設定ファイルぐらい用意しておけよ！")
+    except ValueError:
         return error_page(templates, request, 500, "短縮URLの処理のためのJSONファイルを正常に読み込めませんでした。", "なにこの設定ファイル読めないじゃない！")
 
-    if result := resolve_shorturl(shorturls, full_path):
+    if result:
+        set_route(request.scope, "shorturl")
         return RedirectResponse(url=result)
 
     return error_page(templates, request, 404, "リクエストしたページは現在ご利用になれません。削除/移動されたか、URLが間違っている可能性があります。", "そんなページ知らないっ！")
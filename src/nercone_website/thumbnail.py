@@ -0,0 +1,176 @@
+import os
+import re
+import asyncio
+import hashlib
+import logging
+import threading
+import multiprocessing
+import xml.etree.ElementTree as ET
+from html import escape, unescape
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+from .config import Directories, Files, Caches, Thumbnails
+from .cache import LRUCache
+from .routes import route_index, accepts
+from .limits import limiters
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+templates_dir = Directories.public.joinpath("assets", "images", "thumbnails")
+fonts_dir = Directories.public.joinpath("assets", "fonts")
+cache_dir = Directories.caches.joinpath("thumbnails")
+font_files = [
+    fonts_dir / "MesloBIZUD-Regular.ttf",
+    fonts_dir / "InterBIZUD-Regular.ttf",
+    fonts_dir / "InterBIZUD-Bold.ttf",
+]
+width, height = 1200, 630
+formats = ["png", "webp"] if PIL and Thumbnails.webp else ["png"]
+
+logger = logging.getLogger(__name__)
+memory_cache = LRUCache(Caches.thumbnails)
+store_lock = threading.Lock()
+stored_files: int | None = None
+pending: dict[str, asyncio.Future] = {}
+executor: ProcessPoolExecutor | None = None
+
+def _fingerprint(path: Path) -> str:
+    name = path.relative_to(Directories.public).as_posix()
+    if (info := route_index.info(name)) is None:
+        return f"{name}:missing"
+    return f"{name}:{info.mtime_ns}:{info.size}"
+
+def template_path(template_type: str) -> Path:
+    return templates_dir.joinpath("error.svg" if template_type == "error" else "normal.svg")
+
+def display_path(path: str) -> str:
+    parts = [p for p in path.strip("/").split("/") if p]
+    return "nercone.dev / " + " / ".join(parts) if parts else "nercone.dev"
+
+def thumbnail_key(template_type: str, path: str, title: str, description: str) -> str:
+    digest = hashlib.sha256()
+    for part in [_fingerprint(template_path(template_type)), display_path(path), title, description, *[_fingerprint(font) for font in font_files], f"{width}x{height}"]:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def render_png(svg: str, fonts: list[str]) -> bytes:
+    import resvg_py
+    return resvg_py.svg_to_bytes(svg, font_files=fonts, width=width, height=height)
+
+def render_webp(svg: str, fonts: list[str], quality: int) -> bytes:
+    import io
+    from PIL import Image
+    output = io.BytesIO()
+    Image.open(io.BytesIO(render_png(svg, fonts))).save(output, format="WEBP", quality=quality, method=6)
+    return output.getvalue()
+
+def _executor() -> ProcessPoolExecutor:
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=Thumbnails.workers, mp_context=multiprocessing.get_context("spawn"))
+    return executor
+
+def shutdown() -> None:
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+def _prune() -> int:
+    files = sorted((path for path in cache_dir.iterdir() if not path.name.endswith(".tmp")), key=_mtime)
+    excess = max(len(files) - Thumbnails.max_disk_files * 9 // 10, 0) if len(files) > Thumbnails.max_disk_files else 0
+    for path in files[:excess]:
+        path.unlink(missing_ok=True)
+    return len(files) - excess
+
+def _store(name: str, image: bytes) -> None:
+    # Other workers and the thumbnails/export commands may write the same key at the same time.
+    global stored_files
+    tmp = cache_dir.joinpath(f"{name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp.write_bytes(image)
+        tmp.replace(cache_dir.joinpath(name))
+        with store_lock:
+            if stored_files is None or stored_files >= Thumbnails.max_disk_files:
+                stored_files = _prune()
+            stored_files += 1
+    except OSError:
+        logger.warning("failed to store thumbnail %s on disk", name, exc_info=True)
+        tmp.unlink(missing_ok=True)
+
+async def _render(name: str, template_type: str, path: str, title: str, description: str, format: str) -> bytes:
+    async with limiters["thumbnail"].slot():
+        return await _rasterize(name, template_type, path, title, description, format)
+
+async def _rasterize(name: str, template_type: str, path: str, title: str, description: str, format: str) -> bytes:
+    svg = template_path(template_type).read_text(encoding="utf-8")
+    svg = svg.replace("__PATH__", escape(display_path(path)))
+    svg = svg.replace("__TITLE__", escape(title))
+    svg = svg.replace("__DESCRIPTION__", escape(description))
+    loop = asyncio.get_running_loop()
+    fonts = [str(font) for font in font_files]
+    if format == "webp":
+        image = await loop.run_in_executor(_executor(), render_webp, svg, fonts, Thumbnails.webp_quality)
+    else:
+        image = await loop.run_in_executor(_executor(), render_png, svg, fonts)
+    await asyncio.to_thread(_store, name, image)
+    return image
+
+def negotiate_format(accept: str) -> str:
+    return "webp" if "webp" in formats and accepts(accept, "image/webp") else "png"
+
+async def get_thumbnail(key: str, template_type: str, path: str, title: str, description: str, format: str = "png") -> bytes:
+    name = f"{key}.{format}"
+    if (image := memory_cache.get(name)) is not None:
+        return image
+    cached = cache_dir.joinpath(name)
+    if cached.is_file():
+        image = cached.read_bytes()
+        memory_cache.set(name, image, size=len(image))
+        return image
+
+    if name not in pending:
+        pending[name] = asyncio.ensure_future(_render(name, template_type, path, title, description, format))
+        pending[name].add_done_callback(lambda _: pending.pop(name, None))
+    image = await asyncio.shield(pending[name])
+    memory_cache.set(name, image, size=len(image))
+    return image
+
+og_image_pattern = re.compile(r'<meta property="og:image" content="([^"]*)"')
+
+async def prerender_sitemap() -> int:
+    import httpx
+    from .server import app
+
+    async def prerender_app(scope, receive, send):
+        await app(dict(scope, prerender=True), receive, send)
+
+    count = 0
+    transport = httpx.ASGITransport(app=prerender_app, client=("127.0.0.1", 0))
+    async with httpx.AsyncClient(transport=transport, base_url="http://nercone.dev") as client:
+        for loc in ET.parse(Files.sitemap).getroot().iter("{http://www.sitemaps.org/schemas/sitemap/0.9}loc"):
+            page = await client.get(urlsplit(loc.text.strip()).path or "/")
+            if not (match := og_image_pattern.search(page.text)):
+                continue
+            image_url = urlsplit(unescape(match.group(1)))
+            query = {k: v[0] for k, v in parse_qs(image_url.query).items()}
+            path = image_url.path.split("/images/thumbnails/", 1)[-1]
+            template_type = query.get("template", "normal")
+            title = query.get("title", "Untitled Page")
+            description = query.get("description", "No description.")
+            await get_thumbnail(thumbnail_key(template_type, path, title, description), template_type, path, title, description)
+            count += 1
+    shutdown()
+    return count
@@ -0,0 +1,28 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Callable
+from watchfiles import awatch
+from .config import Directories
+
+logger = logging.getLogger(__name__)
+callbacks: list[Callable[[set[Path]], None]] = []
+
+def on_change(callback: Callable[[set[Path]], None]) -> Callable[[set[Path]], None]:
+    callbacks.append(callback)
+    return callback
+
+def notify(paths: set[Path]) -> None:
+    for callback in callbacks:
+        try:
+            callback(paths)
+        except Exception:
+            logger.exception("file change callback %r failed", callback)
+
+def reload_all(directory: Path = Directories.public) -> None:
+    # Used for SIGHUP, when the watcher may have missed changes (e.g. a bind mount swapped underneath it).
+    notify({path for path in directory.rglob("*") if path.is_file()})
+
+async def watch(stop_event: asyncio.Event, directory: Path = Directories.public) -> None:
+    async for changes in awatch(directory, stop_event=stop_event):
+        notify({Path(path) for _, path in changes})
@@ -0,0 +1,62 @@
+import asyncio
+import sqlite3
+import pytest
+from nercone_website.database import AccessCounter
+
+def stored_value(path) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT value FROM access_counter WHERE rowid = 1").fetchone()[0]
+
+class FailingConnection:
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def execute(self, sql: str, *args):
+        if sql.startswith("UPDATE"):
+            raise sqlite3.OperationalError("database is locked")
+        return self.connection.execute(sql, *args)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.connection.in_transaction
+
+def test_unflushed_increments_are_not_visible(tmp_path):
+    path = tmp_path / "access_counter.db"
+    counter = AccessCounter(path)
+    for _ in range(3):
+        counter.increase()
+    assert counter.get() == 3
+    assert stored_value(path) == 0
+    assert AccessCounter(path).get() == 0
+
+def test_flush_and_stop_persist_every_increment(tmp_path):
+    path = tmp_path / "access_counter.db"
+    counter = AccessCounter(path)
+    for _ in range(3):
+        counter.increase()
+    counter.flush()
+    assert stored_value(path) == 3
+
+    counter.increase()
+    asyncio.run(counter.stop())
+    assert stored_value(path) == 4
+    assert AccessCounter(path).get() == 4
+
+def test_failed_flush_keeps_pending_increments(tmp_path):
+    path = tmp_path / "access_counter.db"
+    counter = AccessCounter(path)
+    for _ in range(3):
+        counter.increase()
+
+    connection = counter.connection
+    counter.connection = FailingConnection(connection)
+    with pytest.raises(sqlite3.OperationalError):
+        counter.flush()
+    assert counter.pending == 3
+    assert counter.get() == 3
+    assert stored_value(path) == 0
+
+    counter.connection = connection
+    counter.flush()
+    assert counter.pending == 0
+    assert stored_value(path) == 3
@@ -0,0 +1,17 @@
+import json
+from nercone_website.logger import AccessLogWriter
+
+def test_failed_batch_is_dropped_and_the_writer_recovers(tmp_path):
+    path = tmp_path / "access.log"
+    path.mkdir()
+    writer = AccessLogWriter(path, socket_path=None)
+    writer._write_batch(['{"i": 0}\n', '{"i": 1}\n'])
+    assert writer.stats()["dropped"] == 2
+    assert writer.file is None
+
+    path.rmdir()
+    writer._write_batch(['{"i": 2}\n'])
+    writer.file.close()
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert lines[0] == {"i": 2}
+    assert writer.stats()["written"] == len(lines)